@@ -0,0 +1,83 @@
+import difflib
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 1000))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 24 * 3600))
+# Порог похожести для нечёткого поиска (0.0–1.0); 0 — только точное совпадение
+ANSWER_CACHE_FUZZY = float(os.environ.get("ANSWER_CACHE_FUZZY", 0))
+
+
+def normalize(text):
+    # "Как подобрать одежду?" и "как  подобрать одежду" дают один ключ
+    text = text.casefold().replace("ё", "е")
+    text = "".join(" " if unicodedata.category(ch)[0] in "PSZC" else ch for ch in text)
+    return " ".join(text.split())
+
+
+# ----------------- LRU-кэш ответов с TTL -----------------
+class AnswerCache:
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, fuzzy=ANSWER_CACHE_FUZZY, key_func=normalize):
+        self.key_func = key_func
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fuzzy = fuzzy
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def get(self, text):
+        key = self.key_func(text)
+        if not key:
+            return None
+
+        answer = self._lookup(key)
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        if self.fuzzy:
+            for match in difflib.get_close_matches(key, self._entries.keys(), n=1, cutoff=self.fuzzy):
+                answer = self._lookup(match)
+                if answer is not None:
+                    self.fuzzy_hits += 1
+                    return answer
+
+        self.misses += 1
+        return None
+
+    def put(self, text, answer):
+        key = self.key_func(text)
+        if not key or not answer:
+            return
+        self._entries[key] = (answer, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.fuzzy_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ARTICLE_CACHE_DB = os.environ.get("ARTICLE_CACHE_DB", str(Path(__file__).parent / "article_cache.sqlite3"))
+# 0 — кэш выключен
+ARTICLE_CACHE_TTL = int(os.environ.get("ARTICLE_CACHE_TTL", 7 * 24 * 3600))
+ARTICLE_CACHE_SIZE = int(os.environ.get("ARTICLE_CACHE_SIZE", 500))
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "yclid", "mc_")
+
+
+def normalize_url(url):
+    # Один и тот же материал под разными ссылками: регистр хоста, метки рекламы, якоря, хвостовой слеш
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith(TRACKING_PARAMS))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+# ----------------- Двухуровневый кэш текста статей -----------------
+# Память (LRU) → SQLite со сжатым zlib текстом. Вызывается из потоков скрейпера, поэтому под локом
+class ArticleCache:
+    def __init__(self, path=ARTICLE_CACHE_DB, ttl=ARTICLE_CACHE_TTL, max_memory=ARTICLE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self.db:
+            self.db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS articles (url TEXT PRIMARY KEY, body BLOB, expires REAL);
+            """)
+            self.db.execute("DELETE FROM articles WHERE expires < ?", (time.time(),))
+
+    def _remember(self, key, text, expires):
+        self._memory[key] = (text, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def get(self, url):
+        if not self.ttl:
+            return None
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                return entry[0]
+
+            row = self.db.execute("SELECT body, expires FROM articles WHERE url = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            text = zlib.decompress(row[0]).decode("utf-8")
+            self._remember(key, text, row[1])
+            return text
+
+    def put(self, url, text):
+        if not self.ttl:
+            return
+        key = normalize_url(url)
+        expires = time.time() + self.ttl
+        body = zlib.compress(text.encode("utf-8"), 6)
+        with self._lock:
+            self._remember(key, text, expires)
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO articles VALUES (?, ?, ?)", (key, body, expires))
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram.ext import AIORateLimiter, ExtBot
+
+import broadcast
+from bench.fake_servers import FakeTelegram
+
+
+# ----------------- Бенчмарк рассылки дайджеста -----------------
+async def run(chats, parts, flood_limit, rate, latency):
+    text = "\n\n".join(f"✨ **Источник {i}**\n" + "• новость " * 400 for i in range(parts))
+
+    async def render():
+        return text, None
+
+    async with FakeTelegram(latency=latency, flood_limit=flood_limit) as telegram:
+        bot = ExtBot(
+            "123:bench",
+            base_url=telegram.bot_url,
+            rate_limiter=AIORateLimiter(overall_max_rate=rate, max_retries=3),
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            store = broadcast.BroadcastStore(f"{tmp}/broadcast.sqlite3")
+            for chat_id in range(1, chats + 1):
+                store.subscribe(chat_id)
+
+            async with bot:
+                started = time.perf_counter()
+                delivered = await broadcast.run_broadcast(bot, store, render)
+                elapsed = time.perf_counter() - started
+
+    messages = sum(1 for m in telegram.sent if m[0] == "sendMessage")
+    print(f"чатов доставлено:   {delivered}/{chats}")
+    print(f"сообщений:          {messages} ({len(broadcast.split_message(text))} на чат)")
+    print(f"ошибок 429:         {telegram.flood_errors}")
+    print(f"время:              {elapsed:.2f} с")
+    print(f"сообщений в секунду: {messages / elapsed:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость рассылки дайджеста через локальный фейковый Bot API")
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--parts", type=int, default=3, help="сколько абзацев-источников в дайджесте")
+    parser.add_argument("--rate", type=float, default=25, help="общий лимит AIORateLimiter, сообщений/с")
+    parser.add_argument("--flood-limit", type=int, default=30, help="порог 429 на фейковом сервере, сообщений/с")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа Bot API, с")
+    parser.add_argument("--per-chat-interval", type=float, default=broadcast.PER_CHAT_INTERVAL)
+    args = parser.parse_args()
+
+    broadcast.PER_CHAT_INTERVAL = args.per_chat_interval
+    asyncio.run(run(args.chats, args.parts, args.flood_limit, args.rate, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench import fake_servers
+
+TEXTS = [
+    "Как подобрать одежду для собеседования?",
+    "Что надеть на свадьбу летом?",
+    "С чем носить бежевый тренч?",
+    "Подойдёт ли оверсайз пиджак невысокой девушке?",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# ----------------- Синтетические апдейты -----------------
+def make_update(update_id, kind):
+    user = {"id": 100000 + update_id, "is_bot": False, "first_name": f"User{update_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user["id"], "type": "private"},
+        "from": user,
+    }
+    if kind == "text":
+        message["text"] = random.choice(TEXTS) + f" #{update_id}"
+    elif kind == "trends":
+        message["text"] = "/trends"
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": 7}]
+    elif kind == "document":
+        message["document"] = {"file_id": f"doc{update_id}", "file_unique_id": f"d{update_id}",
+                               "file_name": "look.jpg", "mime_type": "image/jpeg"}
+        message["caption"] = "Оцени детали"
+    else:
+        message["photo"] = [{"file_id": f"photo{update_id}", "file_unique_id": f"u{update_id}",
+                             "width": 1600, "height": 1200}]
+        message["caption"] = "Оцени образ"
+    return {"update_id": update_id, "message": message}
+
+
+async def drive(args, endpoints):
+    # Окружение должно быть готово до импорта бота: адреса читаются при импорте
+    os.environ.update(
+        TELEGRAM_TOKEN="123:bench", YANDEX_API_KEY="bench", YANDEX_REGION="bench",
+        TELEGRAM_API_URL=endpoints["telegram"], YANDEX_API_URL=endpoints["yandex"],
+        DIGEST_INTERVAL="0", BROADCAST_DB=":memory:", ARTICLE_CACHE_DB=":memory:",
+        YANDEX_HEDGE="1" if args.hedge else "0",
+    )
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    import fashion_bot
+    import scraper
+
+    scraper.SOURCES = [(url, "h2 a, h3 a", f"Site {i}") for i, url in enumerate(endpoints["news"])]
+
+    app = fashion_bot.build_application()
+    started, finished, kinds = {}, {}, {}
+
+    async def record_done(update, context):
+        finished[update.update_id] = time.perf_counter()
+
+    # Группа 99 выполняется после основного обработчика — это момент завершения апдейта
+    app.add_handler(TypeHandler(Update, record_done), group=99)
+
+    weights = {"text": args.text, "photo": args.photo, "document": args.document, "trends": args.trends}
+    stream = random.choices(list(weights), weights=list(weights.values()), k=args.updates)
+
+    async with app:
+        await app.start()
+        bench_started = time.perf_counter()
+        for update_id, kind in enumerate(stream, start=1):
+            kinds[update_id] = kind
+            started[update_id] = time.perf_counter()
+            await app.update_queue.put(Update.de_json(make_update(update_id, kind), app.bot))
+            await asyncio.sleep(random.expovariate(args.rate))
+        await app.update_queue.join()
+        elapsed = time.perf_counter() - bench_started
+        await app.stop()
+
+    return started, finished, kinds, elapsed
+
+
+def fetch_stats(url):
+    import httpx
+
+    return httpx.get(f"{url}/__stats").json()
+
+
+def report(started, finished, kinds, elapsed, endpoints):
+    by_kind = defaultdict(list)
+    for update_id, end in finished.items():
+        latency = end - started[update_id]
+        by_kind[kinds[update_id]].append(latency)
+        by_kind["all"].append(latency)
+
+    print(f"{'тип':<8} {'n':>6} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10}")
+    for kind in ("text", "photo", "document", "trends", "all"):
+        values = by_kind.get(kind, [])
+        if values:
+            print(f"{kind:<8} {len(values):>6} " + " ".join(
+                f"{percentile(values, p) * 1000:>10.0f}" for p in (50, 95, 99)
+            ))
+
+    print(f"\nобработано:     {len(finished)}/{len(started)}")
+    print(f"пропускная:     {len(finished) / elapsed:.1f} апдейтов/с")
+    print(f"пиковый RSS:    {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+    for name in ("telegram", "yandex"):
+        stats = fetch_stats(endpoints[name])
+        print(f"{name + ':':<15} {stats['requests']} запросов, {stats['errors']} ошибок")
+    hedger = sys.modules["yandex_client"].hedger
+    if hedger.sent:
+        print(f"хеджирование:   {hedger.sent} дублей, {hedger.won} быстрее основного")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков бота на локальных заглушках")
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="апдейтов в секунду (пуассоновский поток)")
+    parser.add_argument("--text", type=float, default=0.7, help="доля текстовых сообщений")
+    parser.add_argument("--photo", type=float, default=0.25, help="доля фото")
+    parser.add_argument("--document", type=float, default=0.0, help="доля картинок, присланных документом")
+    parser.add_argument("--trends", type=float, default=0.05, help="доля /trends")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--hedge", action="store_true", help="дублировать медленные запросы к модели")
+    fake_servers.add_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # Заглушки живут в отдельном процессе, чтобы не делить с ботом event loop, CPU и RSS
+    server_args = [f"--{k.replace('_', '-')}={v}" for k, v in vars(args).items()
+                   if k.startswith(("telegram_", "yandex_", "news_"))]
+    servers = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_servers", *server_args],
+        cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        endpoints = json.loads(servers.stdout.readline())
+        started, finished, kinds, elapsed = asyncio.run(drive(args, endpoints))
+        report(started, finished, kinds, elapsed, endpoints)
+    finally:
+        servers.stdin.close()
+        servers.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
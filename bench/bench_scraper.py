@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Кэш статей — в памяти процесса, чтобы прогоны не зависели от файла с прошлого запуска;
+# --article-cache включает его (TTL задаётся при импорте scraper)
+os.environ["ARTICLE_CACHE_DB"] = ":memory:"
+os.environ.setdefault("ARTICLE_CACHE_TTL", "3600" if "--article-cache" in sys.argv else "0")
+
+import scraper
+from bench.fixtures import CORPUS_DIR, Corpus, ReplayAdapter, mount
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def summary(name, samples):
+    samples_ms = [s * 1000 for s in samples]
+    print(f"{name:<32} n={len(samples_ms):<4} min={min(samples_ms):8.2f} "
+          f"med={statistics.median(samples_ms):8.2f} mean={statistics.fmean(samples_ms):8.2f} мс")
+
+
+# ----------------- Бенчмарк парсера на записанном корпусе -----------------
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк scraper.py на записанном корпусе без сети")
+    parser.add_argument("--corpus", default=str(CORPUS_DIR))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="задержка заглушки модели, с")
+    parser.add_argument("--article-cache", action="store_true", help="включить кэш текста статей")
+    args = parser.parse_args()
+
+    corpus = Corpus(args.corpus)
+    if not corpus.index:
+        sys.exit(f"Корпус пуст: сначала python -m bench.fixtures record --corpus {args.corpus}")
+    adapter = ReplayAdapter(corpus)
+    mount(scraper.session, adapter)
+
+    async def stub_predict(model, text, image=None, priority=None):
+        if args.model_latency:
+            await asyncio.sleep(args.model_latency)
+        return f"выжимка {len(text)} символов"
+
+    scraper.predict = stub_predict
+
+    site_samples, article_samples, pipeline_samples = {}, [], []
+    for _ in range(args.repeat):
+        for url, selectors, site_name in scraper.SOURCES:
+            elapsed, src = timed(scraper.fetch_site, url, selectors, site_name)
+            site_samples.setdefault(site_name, []).append(elapsed)
+            for art in (src or {}).get("articles", []):
+                elapsed, _ = timed(scraper.fetch_article_text, art["url"])
+                article_samples.append(elapsed)
+
+        started = time.perf_counter()
+        asyncio.run(scraper.get_fashion_news_with_summary())
+        pipeline_samples.append(time.perf_counter() - started)
+
+    for site_name, samples in site_samples.items():
+        summary(f"fetch_site[{site_name}]", samples)
+    if article_samples:
+        summary("fetch_article_text", article_samples)
+    summary("get_fashion_news_with_summary", pipeline_samples)
+    if adapter.misses:
+        print(f"⚠️ Нет в корпусе: {len(set(adapter.misses))} URL")
+
+
+if __name__ == "__main__":
+    main()
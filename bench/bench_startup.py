@@ -0,0 +1,58 @@
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# ----------------- Время импорта по модулям -----------------
+def import_times(statement):
+    env = dict(os.environ, TELEGRAM_TOKEN="123:bench", YANDEX_API_KEY="bench", YANDEX_REGION="bench",
+               DIGEST_INTERVAL="0", BROADCAST_DB=":memory:")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    # Строки вида "import time:   self |  cumulative | [отступ]имя"
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), len(name) - len(name.lstrip())))
+    return rows
+
+
+def report(title, statement, top):
+    rows = import_times(statement)
+    total = sum(r[1] for r in rows)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        packages[name.split(".")[0]] += self_us
+
+    print(f"\n=== {title}: {total / 1000:.1f} мс, модулей {len(rows)} ===")
+    print("по пакетам (self):")
+    for package, us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        print(f"  {package:<24} {us / 1000:8.1f} мс")
+    print("модули верхнего уровня (cumulative):")
+    first_level = [r for r in rows if r[3] <= 3]
+    for name, _, cumulative_us, _ in sorted(first_level, key=lambda r: -r[2])[:top]:
+        print(f"  {name:<24} {cumulative_us / 1000:8.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта fashion_bot и отложенных подсистем")
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+
+    report("import fashion_bot", "import fashion_bot", args.top)
+    # Отложенные подсистемы грузятся при первом фото / первом дайджесте
+    report("media (первое фото)", "import fashion_bot, media", args.top)
+    report("scraper (первый дайджест)", "import fashion_bot, scraper", args.top)
+
+
+if __name__ == "__main__":
+    main()
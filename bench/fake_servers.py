@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+
+# ----------------- Минимальный HTTP/1.1 сервер -----------------
+class FakeServer:
+    # latency — базовая задержка, jitter — средний экспоненциальный хвост сверху, error_rate — доля ответов 500;
+    # slow_rate — доля «застрявших» запросов, которые ждут ещё slow_latency секунд
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, slow_rate=0.0, slow_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self.port = None
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def handle(self, method, path, query, body):
+        return 404, {"Content-Type": "text/plain"}, b"not found"
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                parts = urlsplit(target)
+                if parts.path == "/__stats":
+                    status, out_headers, payload = json_response(200, {"requests": self.requests, "errors": self.errors})
+                else:
+                    self.requests += 1
+                    delay = self.latency + (random.expovariate(1 / self.jitter) if self.jitter else 0)
+                    if self.slow_rate and random.random() < self.slow_rate:
+                        delay += self.slow_latency
+                    if delay:
+                        await asyncio.sleep(delay)
+                    if self.error_rate and random.random() < self.error_rate:
+                        self.errors += 1
+                        status, out_headers, payload = json_response(500, {"error": "injected"})
+                    else:
+                        status, out_headers, payload = await self.handle(method, parts.path, parse_qs(parts.query), body)
+
+                if isinstance(payload, bytes):
+                    head = [f"HTTP/1.1 {status} X", f"Content-Length: {len(payload)}"]
+                    head += [f"{k}: {v}" for k, v in out_headers.items()]
+                    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                    await writer.drain()
+                    continue
+
+                # Асинхронный итератор — отдаём по кускам (chunked), как потоковый API
+                head = [f"HTTP/1.1 {status} X", "Transfer-Encoding: chunked"]
+                head += [f"{k}: {v}" for k, v in out_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                async for chunk in payload:
+                    writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def json_response(status, data, headers=None):
+    out = {"Content-Type": "application/json"}
+    out.update(headers or {})
+    return status, out, json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+# ----------------- Telegram Bot API -----------------
+class FakeTelegram(FakeServer):
+    # flood_limit — сколько sendMessage в секунду принимаем, дальше отвечаем 429 как Telegram
+    def __init__(self, latency=0.0, flood_limit=0, photo=b"", **kwargs):
+        super().__init__(latency, **kwargs)
+        self.flood_limit = flood_limit
+        self.photo = photo
+        self.sent = []
+        self.flood_errors = 0
+        self._window = (0, 0)
+        self._message_id = 0
+
+    @property
+    def bot_url(self):
+        return f"{self.base_url}/bot"
+
+    def _flooded(self):
+        second = int(time.monotonic())
+        start, count = self._window
+        if start != second:
+            start, count = second, 0
+        count += 1
+        self._window = (start, count)
+        return self.flood_limit and count > self.flood_limit
+
+    async def handle(self, method, path, query, body):
+        if path.startswith("/file/"):
+            return 200, {"Content-Type": "image/jpeg"}, self.photo
+
+        api_method = path.rsplit("/", 1)[-1]
+        params = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+
+        if api_method == "getFile":
+            return json_response(200, {"ok": True, "result": {
+                "file_id": params.get("file_id", ""), "file_unique_id": params.get("file_id", ""),
+                "file_size": len(self.photo), "file_path": "photos/bench.jpg",
+            }})
+
+        if api_method == "getMe":
+            return json_response(200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }})
+
+        if api_method in ("sendMessage", "editMessageText"):
+            if self._flooded():
+                self.flood_errors += 1
+                return json_response(429, {
+                    "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                })
+            chat_id = int(params.get("chat_id", 0))
+            self._message_id += 1
+            self.sent.append((api_method, chat_id, params.get("text", ""), time.monotonic()))
+            return json_response(200, {"ok": True, "result": {
+                "message_id": int(params.get("message_id", self._message_id)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+                "text": params.get("text", ""),
+            }})
+
+        return json_response(200, {"ok": True, "result": True})
+
+
+# ----------------- Yandex :predict -----------------
+class FakeYandex(FakeServer):
+    # rate_limit — запросов в секунду, сверх которых отвечаем 429 с Retry-After;
+    # stream_chunks — на сколько кусков делить ответ на запрос со "stream": true
+    def __init__(self, rate_limit=0, stream_chunks=8, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limit = rate_limit
+        self.stream_chunks = stream_chunks
+        self.throttled = 0
+        self._window = (0, 0)
+
+    def _throttled(self):
+        second = int(time.monotonic())
+        start, count = self._window
+        if start != second:
+            start, count = second, 0
+        count += 1
+        self._window = (start, count)
+        return self.rate_limit and count > self.rate_limit
+
+    async def handle(self, method, path, query, body):
+        if not path.endswith(":predict"):
+            return json_response(404, {"error": "unknown model"})
+        if self._throttled():
+            self.throttled += 1
+            return json_response(429, {"error": "rate limited"}, {"Retry-After": "1"})
+
+        request = json.loads(body)
+        instance = request["instances"][0]
+        model = path.rsplit("/", 1)[-1].split(":")[0]
+        output = f"[{model}] ответ на {len(instance.get('text', ''))} символов. " + "Совет стилиста. " * 20
+        if not request.get("stream"):
+            return json_response(200, {"predictions": [{"output_text": output}]})
+
+        async def chunks():
+            # Базовая задержка уже выдержана до первого куска; остальные идут с тем же шагом
+            step = max(1, len(output) // self.stream_chunks)
+            for end in range(step, len(output) + step, step):
+                line = {"predictions": [{"output_text": output[:end]}]}
+                yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                await asyncio.sleep(self.latency / self.stream_chunks)
+
+        return 200, {"Content-Type": "application/x-ndjson"}, chunks()
+
+
+# ----------------- Новостные сайты -----------------
+class FakeNewsSites(FakeServer):
+    # /site{i}/ — главная со ссылками в h2/h3, /site{i}/article{j} — статья из абзацев
+    def __init__(self, sites=8, articles=5, paragraphs=20, **kwargs):
+        super().__init__(**kwargs)
+        self.sites = sites
+        self.articles = articles
+        self.paragraphs = paragraphs
+
+    def source_urls(self):
+        return [f"{self.base_url}/site{i}/" for i in range(self.sites)]
+
+    async def handle(self, method, path, query, body):
+        segments = [p for p in path.split("/") if p]
+        if len(segments) == 1:
+            links = "".join(
+                f'<h3><a href="/{segments[0]}/article{j}">Тренд сезона №{j}</a></h3>' for j in range(self.articles)
+            )
+            html = f"<html><body><h2><a href='/{segments[0]}/'>{segments[0]}</a></h2>{links}</body></html>"
+        else:
+            text = "Модный абзац о сезоне, цветах и силуэтах. " * 8
+            html = "<html><body>" + f"<p>{text}</p>" * self.paragraphs + "</body></html>"
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, html.encode("utf-8")
+
+
+def sample_photo(size=(1600, 1200)):
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# ----------------- Запуск в отдельном процессе -----------------
+async def serve(args):
+    telegram = FakeTelegram(latency=args.telegram_latency, error_rate=args.telegram_errors, photo=sample_photo())
+    yandex = FakeYandex(latency=args.yandex_latency, jitter=args.yandex_jitter,
+                        error_rate=args.yandex_errors, rate_limit=args.yandex_rate_limit,
+                        slow_rate=args.yandex_slow_rate, slow_latency=args.yandex_slow_latency)
+    news = FakeNewsSites(latency=args.news_latency, error_rate=args.news_errors)
+    for server in (telegram, yandex, news):
+        await server.start()
+
+    print(json.dumps({
+        "telegram": telegram.base_url, "yandex": yandex.base_url,
+        "news": news.source_urls(),
+    }), flush=True)
+    # Родитель закрывает stdin — значит, пора завершаться
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.read)
+
+
+def add_arguments(parser):
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--telegram-errors", type=float, default=0.0)
+    parser.add_argument("--yandex-latency", type=float, default=0.3)
+    parser.add_argument("--yandex-jitter", type=float, default=0.1)
+    parser.add_argument("--yandex-errors", type=float, default=0.0)
+    parser.add_argument("--yandex-rate-limit", type=int, default=0)
+    parser.add_argument("--yandex-slow-rate", type=float, default=0.0, help="доля запросов с долгим хвостом")
+    parser.add_argument("--yandex-slow-latency", type=float, default=5.0)
+    parser.add_argument("--news-latency", type=float, default=0.05)
+    parser.add_argument("--news-errors", type=float, default=0.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальные заглушки Telegram, Yandex и новостных сайтов")
+    add_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
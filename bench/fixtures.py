@@ -0,0 +1,121 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+
+# ----------------- Корпус записанных страниц -----------------
+class Corpus:
+    def __init__(self, path=CORPUS_DIR):
+        self.path = Path(path)
+        self.index_path = self.path / "index.json"
+        self.index = json.loads(self.index_path.read_text("utf-8")) if self.index_path.exists() else {}
+
+    def save(self, url, response):
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html"
+        (self.path / name).write_bytes(response.content)
+        self.index[url] = {
+            "status": response.status_code,
+            "file": name,
+            "encoding": response.encoding,
+            "content_type": response.headers.get("Content-Type", "text/html"),
+        }
+        # Без Location записанный редирект проигрывается как пустая страница
+        if "Location" in response.headers:
+            self.index[url]["location"] = response.headers["Location"]
+
+    def flush(self):
+        self.index_path.write_text(json.dumps(self.index, ensure_ascii=False, indent=1), "utf-8")
+
+    def load(self, url):
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+        return entry, (self.path / entry["file"]).read_bytes()
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, corpus):
+        super().__init__()
+        self.corpus = corpus
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        self.corpus.save(request.url, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    # Не записанный URL отдаём как 404 — так же, как пропавшую страницу
+    def __init__(self, corpus):
+        super().__init__()
+        self.corpus = corpus
+        self.misses = []
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        loaded = self.corpus.load(request.url)
+        if loaded is None:
+            self.misses.append(request.url)
+            response.status_code = 404
+            response._content = b""
+            return response
+        entry, body = loaded
+        response.status_code = entry["status"]
+        response.encoding = entry["encoding"]
+        response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"]})
+        if "location" in entry:
+            response.headers["Location"] = entry["location"]
+        response._content = body
+        return response
+
+    def close(self):
+        pass
+
+
+def mount(session, adapter):
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+# ----------------- Запись -----------------
+def record(corpus_dir):
+    # Кэш статей на диске (его греют бот и scraper.py --serve) спрятал бы статьи от записи
+    os.environ["ARTICLE_CACHE_DB"] = ":memory:"
+    os.environ["ARTICLE_CACHE_TTL"] = "0"
+    import scraper
+
+    corpus = Corpus(corpus_dir)
+    mount(scraper.session, RecordingAdapter(corpus))
+
+    for src in scraper.get_sources():
+        if not src:
+            continue
+        print(f"📥 {src['site']}: {len(src['articles'])} статей")
+        for art in src["articles"]:
+            scraper.fetch_article_text(art["url"])
+
+    corpus.flush()
+    print(f"✅ Записано страниц: {len(corpus.index)} → {corpus.path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запись главных страниц и статей всех источников в локальный корпус")
+    parser.add_argument("command", choices=["record"])
+    parser.add_argument("--corpus", default=str(CORPUS_DIR))
+    args = parser.parse_args()
+    record(args.corpus)
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TelegramError
+
+BROADCAST_DB = os.environ.get("BROADCAST_DB", str(Path(__file__).parent / "broadcast.sqlite3"))
+DIGEST_INTERVAL = int(os.environ.get("DIGEST_INTERVAL", 6 * 3600))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 20))
+PER_CHAT_INTERVAL = float(os.environ.get("PER_CHAT_INTERVAL", 1.0))
+# Сколько запусков подряд доставка в чат может упираться в сеть, прежде чем её бросим
+BROADCAST_MAX_ATTEMPTS = int(os.environ.get("BROADCAST_MAX_ATTEMPTS", 3))
+MESSAGE_LIMIT = 4096
+
+
+# ----------------- Хранилище подписок и очереди рассылки -----------------
+class BroadcastStore:
+    def __init__(self, path=BROADCAST_DB):
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, created REAL);
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT, created REAL, finished REAL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                broadcast_id INTEGER, chat_id INTEGER, status TEXT DEFAULT 'pending', parts_sent INTEGER DEFAULT 0,
+                PRIMARY KEY (broadcast_id, chat_id)
+            );
+        """)
+        # Базы, созданные до счётчика попыток
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(deliveries)")}
+        if "attempts" not in columns:
+            with self.db:
+                self.db.execute("ALTER TABLE deliveries ADD COLUMN attempts INTEGER DEFAULT 0")
+        # ...и до версии дайджеста у рассылки
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(broadcasts)")}
+        if "version" not in columns:
+            with self.db:
+                self.db.execute("ALTER TABLE broadcasts ADD COLUMN version INTEGER")
+
+    def subscribe(self, chat_id):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO subscribers VALUES (?, ?)", (chat_id, time.time()))
+
+    def unsubscribe(self, chat_id):
+        with self.db:
+            self.db.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+
+    def migrate(self, chat_id, new_chat_id):
+        # Группа стала супергруппой: подписка переезжает на новый chat_id
+        with self.db:
+            self.db.execute("DELETE FROM subscribers WHERE chat_id = ?", (new_chat_id,))
+            self.db.execute("UPDATE subscribers SET chat_id = ? WHERE chat_id = ?", (new_chat_id, chat_id))
+
+    def has_subscribers(self):
+        return self.db.execute("SELECT 1 FROM subscribers LIMIT 1").fetchone() is not None
+
+    def unfinished(self):
+        return self.db.execute(
+            "SELECT id, text FROM broadcasts WHERE finished IS NULL ORDER BY id LIMIT 1"
+        ).fetchone()
+
+    def last_version(self):
+        row = self.db.execute(
+            "SELECT version FROM broadcasts WHERE version IS NOT NULL ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def enqueue(self, text, version=None):
+        # Снимок подписчиков фиксируется вместе с текстом, чтобы после падения отправить ровно то же самое
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO broadcasts (text, created, version) VALUES (?, ?, ?)", (text, time.time(), version)
+            )
+            self.db.execute(
+                "INSERT INTO deliveries (broadcast_id, chat_id) SELECT ?, chat_id FROM subscribers",
+                (cur.lastrowid,),
+            )
+        return cur.lastrowid
+
+    def pending(self, broadcast_id):
+        return self.db.execute(
+            "SELECT chat_id, parts_sent FROM deliveries WHERE broadcast_id = ? AND status = 'pending'",
+            (broadcast_id,),
+        ).fetchall()
+
+    def mark(self, broadcast_id, chat_id, status, parts_sent):
+        with self.db:
+            self.db.execute(
+                "UPDATE deliveries SET status = ?, parts_sent = ? WHERE broadcast_id = ? AND chat_id = ?",
+                (status, parts_sent, broadcast_id, chat_id),
+            )
+
+    def retry_later(self, broadcast_id, chat_id, parts_sent):
+        # Доставка остаётся в очереди до BROADCAST_MAX_ATTEMPTS запусков, потом считается неудачной
+        with self.db:
+            self.db.execute(
+                "UPDATE deliveries SET parts_sent = ?, attempts = attempts + 1, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END "
+                "WHERE broadcast_id = ? AND chat_id = ?",
+                (parts_sent, BROADCAST_MAX_ATTEMPTS, broadcast_id, chat_id),
+            )
+
+    def finish(self, broadcast_id):
+        with self.db:
+            self.db.execute("UPDATE broadcasts SET finished = ? WHERE id = ?", (time.time(), broadcast_id))
+
+
+# ----------------- Рассылка -----------------
+def split_message(text, limit=MESSAGE_LIMIT):
+    # Режем по абзацам, чтобы не ломать Markdown-разметку ссылок
+    parts, current = [], ""
+    for block in text.split("\n\n"):
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            parts.append(current)
+        while len(block) > limit:
+            parts.append(block[:limit])
+            block = block[limit:]
+        current = block
+    if current:
+        parts.append(current)
+    return parts
+
+
+async def _deliver(bot, store, broadcast_id, chat_id, parts, parts_sent):
+    # Строка доставки остаётся под исходным chat_id, даже если чат переехал
+    target = chat_id
+    try:
+        for i in range(parts_sent, len(parts)):
+            if i > parts_sent:
+                await asyncio.sleep(PER_CHAT_INTERVAL)
+            try:
+                await bot.send_message(target, parts[i], parse_mode="Markdown")
+            except ChatMigrated as e:
+                store.migrate(target, e.new_chat_id)
+                target = e.new_chat_id
+                await bot.send_message(target, parts[i], parse_mode="Markdown")
+            parts_sent = i + 1
+            store.mark(broadcast_id, chat_id, "pending", parts_sent)
+        store.mark(broadcast_id, chat_id, "sent", parts_sent)
+        return True
+    except Forbidden:
+        store.unsubscribe(chat_id)
+        store.mark(broadcast_id, chat_id, "blocked", parts_sent)
+    except (BadRequest, RetryAfter) as e:
+        print(f"❌ Рассылка в {chat_id}: ошибка {e}")
+        store.mark(broadcast_id, chat_id, "failed", parts_sent)
+    except NetworkError as e:
+        # Остаётся в очереди, доотправим при следующем запуске
+        print(f"❌ Рассылка в {chat_id}: сеть {e}")
+        store.retry_later(broadcast_id, chat_id, parts_sent)
+    except TelegramError as e:
+        # Любая другая ошибка Telegram окончательна: иначе рассылка никогда не завершится
+        print(f"❌ Рассылка в {chat_id}: ошибка {e}")
+        store.mark(broadcast_id, chat_id, "failed", parts_sent)
+    return False
+
+
+async def run_broadcast(bot, store, render):
+    # Незавершённая рассылка после падения продолжается с того же места, без повторного рендера.
+    # render() возвращает (текст, версия) или None, если дайджеста нет. Версия (если есть)
+    # не рассылается дважды — сервис дайджестов мог не обновить её с прошлого раза
+    row = store.unfinished()
+    if row:
+        broadcast_id, text = row
+    elif not store.has_subscribers():
+        # Некому слать — не тратим скрейпинг и суммаризацию впустую
+        return 0
+    else:
+        rendered = await render()
+        if rendered is None:
+            return 0
+        text, version = rendered
+        if version is not None and version == store.last_version():
+            return 0
+        broadcast_id = store.enqueue(text, version)
+
+    parts = split_message(text)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def worker(chat_id, parts_sent):
+        async with semaphore:
+            return await _deliver(bot, store, broadcast_id, chat_id, parts, parts_sent)
+
+    results = await asyncio.gather(*(worker(c, s) for c, s in store.pending(broadcast_id)))
+    if not store.pending(broadcast_id):
+        store.finish(broadcast_id)
+    return sum(results)
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+DIGEST_DB = os.environ.get("DIGEST_DB", str(Path(__file__).parent / "digests.sqlite3"))
+# Сколько последних версий дайджеста хранить
+DIGEST_KEEP = int(os.environ.get("DIGEST_KEEP", 10))
+
+
+# ----------------- Общее хранилище дайджестов -----------------
+# Пишет процесс scraper.py --serve, читают воркеры бота. WAL: чтение не ждёт записи
+class DigestStore:
+    def __init__(self, path=DIGEST_DB, keep=DIGEST_KEEP):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._cached = None
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self.db:
+            self.db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS digests (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT, built_at REAL, body BLOB
+                );
+            """)
+
+    def publish(self, text):
+        body = zlib.compress(text.encode("utf-8"), 6)
+        with self._lock, self.db:
+            version = self.db.execute(
+                "INSERT INTO digests (built_at, body) VALUES (?, ?)", (time.time(), body)
+            ).lastrowid
+            self.db.execute("DELETE FROM digests WHERE version <= ?", (version - self.keep,))
+        return version
+
+    def latest(self):
+        # (версия, время сборки, текст) или None, пока сервис не опубликовал ни одного дайджеста.
+        # Текст распаковывается только при смене версии
+        with self._lock:
+            row = self.db.execute("SELECT MAX(version) FROM digests").fetchone()
+            if row[0] is None:
+                return None
+            if self._cached is None or self._cached[0] != row[0]:
+                version, built_at, body = self.db.execute(
+                    "SELECT version, built_at, body FROM digests WHERE version = ?", (row[0],)
+                ).fetchone()
+                self._cached = (version, built_at, zlib.decompress(body).decode("utf-8"))
+            return self._cached
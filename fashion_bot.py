@@ -1,56 +1,190 @@
 from dotenv import load_dotenv
 from pathlib import Path
+import asyncio
 import os
-import io
+import time
 import base64
-from PIL import Image
-import httpx
 
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.ext import AIORateLimiter, Application, CommandHandler, MessageHandler, TypeHandler, filters
 from telegram.constants import ChatAction
-
-from scraper import get_fashion_news_with_summary
+from telegram.error import TelegramError
+
+from broadcast import DIGEST_INTERVAL, MESSAGE_LIMIT, BroadcastStore, run_broadcast, split_message
+from yandex_client import INTERACTIVE, predict, predict_stream
+from answer_cache import AnswerCache, normalize
+from intents import router, trivial
+from metrics import ANSWER_CACHE, MODEL_ROUTES, STAGE_SECONDS, UPDATES, span, start_metrics_server
+from profiling import PROFILE_DIR, instrument, profile_command
+from loop_monitor import monitor
+from singleflight import SingleFlight
+from lanes import LaneUpdateProcessor, overloaded
+from quotas import UserQuotas
+from user_tasks import Superseded, UserTasks
 
 # ----------------- .env -----------------
 env_path = Path(__file__).parent / ".env"
 load_dotenv(dotenv_path=env_path)
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 YANDEX_API_KEY = os.environ.get("YANDEX_API_KEY")
-YANDEX_REGION = os.environ.get("YANDEX_REGION")
+YANDEX_REGION = os.environ.get("YANDEX_REGION") or os.environ.get("YANDEX_REGIONS")
+# Свой Bot API сервер (локальный telegram-bot-api или заглушка бенчмарка); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
 YANDEX_IMAGE_MODEL = "general-image-analysis"
-
-if not TELEGRAM_TOKEN or not YANDEX_API_KEY:
-    raise ValueError("❌ TELEGRAM_TOKEN или YANDEX_API_KEY не найдены")
+YANDEX_TEXT_MODEL = "general-text-summarizer"
+# Короткие простые вопросы — облегчённой модели (если задана) и с коротким промптом
+YANDEX_LIGHT_MODEL = os.environ.get("YANDEX_LIGHT_MODEL", YANDEX_TEXT_MODEL)
+LIGHT_MAX_WORDS = int(os.environ.get("LIGHT_MAX_WORDS", 12))
+# Сколько секунд готовый дайджест отдаётся всем без повторной сборки
+DIGEST_GRACE_TTL = float(os.environ.get("DIGEST_GRACE_TTL", 120))
+# store — дайджест собирает отдельный процесс (scraper.py --serve), бот только читает хранилище;
+# snapshot — то же, но из общего для всех воркеров снимка через mmap; local — сборка внутри бота.
+# Для store и snapshot рядом с воркером нужен процесс «scraper: python scraper.py --serve»
+DIGEST_SOURCE = os.environ.get("DIGEST_SOURCE", "local")
+# Не чаще одной правки сообщения за интервал — в пределах лимитов Telegram на editMessageText
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", 1.5))
+# Окно склейки быстрых сообщений в один запрос к модели, секунды; 0 — новое сообщение просто отменяет старое
+CHAT_MERGE_WINDOW = float(os.environ.get("CHAT_MERGE_WINDOW", 0))
+
+if not TELEGRAM_TOKEN or not YANDEX_API_KEY or not YANDEX_REGION:
+    raise ValueError("❌ TELEGRAM_TOKEN, YANDEX_API_KEY или YANDEX_REGION не найдены")
 
 user_conversations = {}
-keywords = ["мода", "новости моды", "fashion", "тренды"]
+broadcast_store = BroadcastStore()
+answer_cache = AnswerCache()
+# Анализ одного и того же файла с той же подписью повторно не запрашиваем
+image_cache = AnswerCache(fuzzy=0, key_func=str.strip)
+# keep_last: при перегрузке отдаём последний собранный дайджест, даже устаревший
+digest_flight = SingleFlight(grace=DIGEST_GRACE_TTL, keep_last=True)
+digest_store = None
+digest_snapshot = None
+quotas = UserQuotas()
+user_tasks = UserTasks()
+# Сообщения пользователя, на которые ещё не ушёл ответ модели
+pending_messages = {}
+BUSY_REPLY = "⏳ Сейчас слишком много запросов, попробуй чуть позже."
+SMALLTALK_REPLIES = {
+    "greeting": "👋 Привет! Спроси про стиль или пришли фото образа — разберу.",
+    "thanks": "😊 Рада помочь! Если будут ещё вопросы о стиле — пиши.",
+}
+
+
+async def build_fashion_news():
+    # scraper тянет requests и bs4 — грузим его только при первом запросе дайджеста
+    from scraper import get_fashion_news_with_summary
+    with span("digest_build"):
+        return await get_fashion_news_with_summary()
+
+
+# Читатели опубликованного дайджеста: (текст, версия) или None, пока сервис ничего не опубликовал
+def read_fashion_news():
+    from digest_store import DigestStore
+
+    global digest_store
+    if digest_store is None:
+        digest_store = DigestStore()
+    latest = digest_store.latest()
+    return (latest[2], latest[0]) if latest else None
+
+
+def read_snapshot_news():
+    from snapshot import SnapshotReader
+
+    global digest_snapshot
+    if digest_snapshot is None:
+        digest_snapshot = SnapshotReader()
+    snapshot = digest_snapshot.current()
+    return (snapshot.text, snapshot.version) if snapshot else None
+
+
+def read_published_news():
+    return read_fashion_news() if DIGEST_SOURCE == "store" else read_snapshot_news()
 
 
 async def get_fashion_news():
-    return get_fashion_news_with_summary()
+    if DIGEST_SOURCE in ("store", "snapshot"):
+        published = read_published_news()
+        return published[0] if published else "⏳ Дайджест ещё готовится, загляни чуть позже."
+    # Сколько бы пользователей ни попросили дайджест одновременно, в сеть идёт одна сборка
+    if overloaded():
+        return digest_flight.stale("digest") or BUSY_REPLY
+    return await digest_flight.do("digest", build_fashion_news)
 
 
-async def analyze_image_yandex(image_bytes, caption=""):
-    url = f"https://{YANDEX_REGION}.api.cloud.yandex.net/ai/v1/models/{YANDEX_IMAGE_MODEL}:predict"
+async def analyze_image_yandex(image_bytes, caption="", cache_key=None):
     image_base64 = base64.b64encode(image_bytes).decode("utf-8")
     prompt = f"Проанализируй модный образ на фото. {caption}"
 
-    payload = {"instances": [{"text": prompt, "image": image_base64}]}
-    headers = {"Authorization": f"Bearer {YANDEX_API_KEY}"}
+    try:
+        output = await predict(YANDEX_IMAGE_MODEL, prompt, image=image_base64, priority=INTERACTIVE)
+        if cache_key:
+            image_cache.put(cache_key, output)
+        return output or "Анализ недоступен"
+    except Exception as e:
+        print(f"❌ Ошибка анализа изображения: {e}")
+        return None
+
+
+# ----------------- Постепенный ответ -----------------
+class ProgressiveReply:
+    def __init__(self, message):
+        self.message = message
+        self.sent = None
+        self.shown = ""
+        self.last_edit = 0.0
+
+    async def update(self, text, final=False):
+        # Пока идёт генерация, показываем первые MESSAGE_LIMIT символов; в финале хвост уходит
+        # отдельными сообщениями — Telegram не примет одно сообщение длиннее лимита
+        if not text:
+            return
+        parts = split_message(text) if final else [text[:MESSAGE_LIMIT]]
+        head = parts[0]
+        if head != self.shown and (final or time.monotonic() - self.last_edit >= STREAM_EDIT_INTERVAL):
+            if self.sent is None:
+                self.sent = await self.message.reply_text(head)
+            else:
+                await self.sent.edit_text(head)
+            self.shown, self.last_edit = head, time.monotonic()
+        for part in parts[1:]:
+            await self.message.reply_text(part)
+
+
+async def admit_user(update, kind, key):
+    # Флуд-контроль перед загрузкой и моделью; повтор того же запроса молча схлопывается
+    user_id = update.effective_user.id
+    decision = quotas.check(user_id, kind, key)
+    if decision == "limited":
+        wait = max(1, round(quotas.retry_after(user_id, kind)))
+        await update.effective_message.reply_text(f"🐢 Слишком много запросов подряд, подожди {wait} с.")
+    return decision == "ok"
+
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("predictions", [{}])[0].get("output_text", "Анализ недоступен")
-        except Exception as e:
-            print(f"❌ Ошибка анализа изображения: {e}")
-            return "Ошибка при анализе изображения"
+def text_route(question):
+    # Один вопрос в одно предложение — лёгкий путь; длинные, составные и склеенные — полный
+    sentences = sum(question.count(mark) for mark in ".?!")
+    if "\n" not in question and sentences <= 1 and len(normalize(question).split()) <= LIGHT_MAX_WORDS:
+        return "light", YANDEX_LIGHT_MODEL, f"Ты AI-стилист. Ответь кратко, в 2–3 предложениях:\n{question}"
+    return "heavy", YANDEX_TEXT_MODEL, f"Ты AI-стилист. Ответь подробно на сообщение:\n{question}"
 
 
 # ----------------- Обработчики -----------------
+async def track_update(update: Update, context):
+    # Группа -1: срабатывает до основных обработчиков и не мешает им
+    message = update.effective_message
+    if message is None:
+        UPDATES.inc(kind="other")
+        return
+    if message.photo:
+        kind = "photo"
+    elif message.document:
+        kind = "document"
+    else:
+        kind = "command" if (message.text or "").startswith("/") else "text"
+    UPDATES.inc(kind=kind)
+    STAGE_SECONDS.observe(max(0.0, time.time() - message.date.timestamp()), stage="update_receive")
+
+
 async def start(update: Update, context):
     user_id = update.effective_user.id
     user_name = update.effective_user.first_name
@@ -60,18 +194,24 @@ async def start(update: Update, context):
 
 async def help_command(update: Update, context):
     await update.message.reply_text(
-        "💡 Примеры:\n- Как подобрать одежду?\n- Оцени мой образ\n- Новости моды: 'мода', 'тренды'"
+        "💡 Примеры:\n- Как подобрать одежду?\n- Оцени мой образ\n- Новости моды: 'мода', 'тренды'\n"
+        "- /subscribe — получать дайджест автоматически"
     )
 
 
 async def clear_history(update: Update, context):
     user_id = update.effective_user.id
     user_conversations[user_id] = []
+    pending_messages.pop(user_id, None)
+    user_tasks.cancel(user_id)
+    # Отменённый ответ не должен превращать тот же вопрос после /clear в «дубль»
+    quotas.forget(user_id)
     await update.message.reply_text("✨ История очищена!")
 
 
 async def trends(update: Update, context):
-    await update.message.reply_text("⏳ Собираю новости...")
+    if not overloaded():
+        await update.message.reply_text("⏳ Собираю новости...")
     try:
         news = await get_fashion_news()
         await update.message.reply_text(news, parse_mode="Markdown")
@@ -79,6 +219,37 @@ async def trends(update: Update, context):
         await update.message.reply_text(f"⚠️ Ошибка при формировании новостей: {e}")
 
 
+async def subscribe(update: Update, context):
+    broadcast_store.subscribe(update.effective_chat.id)
+    await update.message.reply_text("🔔 Подписка оформлена! Дайджест будет приходить автоматически.")
+
+
+async def unsubscribe(update: Update, context):
+    broadcast_store.unsubscribe(update.effective_chat.id)
+    await update.message.reply_text("🔕 Подписка отменена.")
+
+
+async def render_digest():
+    # (текст, версия) для рассылки или None, если слать нечего. Опубликованная версия уходит
+    # подписчикам один раз, даже если сервис дайджестов давно не обновлял её
+    if DIGEST_SOURCE in ("store", "snapshot"):
+        return read_published_news()
+
+    # Заглушку «нет новостей» после сбоя всех источников подписчикам не шлём
+    from scraper import NO_NEWS
+
+    news = await get_fashion_news()
+    return None if news in (NO_NEWS, BUSY_REPLY) else (news, None)
+
+
+async def digest_job(context):
+    try:
+        delivered = await run_broadcast(context.bot, broadcast_store, render_digest)
+        print(f"📬 Дайджест доставлен в {delivered} чатов")
+    except Exception as e:
+        print(f"❌ Ошибка рассылки дайджеста: {e}")
+
+
 async def handle_message(update: Update, context):
     user_id = update.effective_user.id
     user_message = update.message.text
@@ -86,64 +257,177 @@ async def handle_message(update: Update, context):
         user_conversations[user_id] = []
 
     user_conversations[user_id].append({"role": "user", "content": user_message})
-    await update.message.chat.send_action(ChatAction.TYPING)
-
-    if any(k.lower() in user_message.lower() for k in keywords):
+    if router.route(user_message) == "news":
+        await update.message.chat.send_action(ChatAction.TYPING)
         news = await get_fashion_news()
         await update.message.reply_text(news, parse_mode="Markdown")
         return
 
-    prompt = f"Ты AI-стилист. Ответь подробно на сообщение:\n{user_message}"
-    url = f"https://{YANDEX_REGION}.api.cloud.yandex.net/ai/v1/models/general-text-summarizer:predict"
-    payload = {"instances": [{"text": prompt}]}
-    headers = {"Authorization": f"Bearer {YANDEX_API_KEY}"}
+    # Приветствия и благодарности не стоят вызова модели
+    smalltalk = trivial(user_message)
+    if smalltalk:
+        MODEL_ROUTES.inc(route="template")
+        await update.message.reply_text(SMALLTALK_REPLIES[smalltalk])
+        return
+
+    # Ответ зависит только от текста сообщения, поэтому частые вопросы отдаём из кэша
+    answer = answer_cache.get(user_message)
+    ANSWER_CACHE.inc(result="miss" if answer is None else "hit")
+    if answer is not None:
+        MODEL_ROUTES.inc(route="cache")
+        with span("reply_send"):
+            await update.message.reply_text(answer)
+        return
+    if overloaded():
+        await update.message.reply_text(BUSY_REPLY)
+        return
+    # Квоту тратит только то, что действительно пойдёт в модель: кэш и отказ под нагрузкой бесплатны
+    if not await admit_user(update, "text", user_message):
+        return
+    await update.message.chat.send_action(ChatAction.TYPING)
+
+    # Новое сообщение вытесняет ещё не отвеченное; с CHAT_MERGE_WINDOW они склеиваются в один запрос
+    pending = pending_messages.setdefault(user_id, [])
+    if not CHAT_MERGE_WINDOW:
+        pending.clear()
+    pending.append(user_message)
+    reply = ProgressiveReply(update.message)
+    try:
+        answer = await user_tasks.run(user_id, answer_stream(user_id, reply))
+    except Superseded:
+        # Вытесненное сообщение не считается отвеченным
+        quotas.forget(user_id, "text", user_message)
+        return
 
-    async with httpx.AsyncClient(timeout=30) as client:
+    with span("reply_send"):
         try:
-            response = await client.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            answer = data.get("predictions", [{}])[0].get("output_text", "Ответ недоступен")
-        except Exception as e:
-            answer = f"😔 Ошибка: {e}"
+            await reply.update(answer, final=True)
+        except TelegramError as e:
+            print(f"❌ Не удалось отправить ответ {user_id}: {e}")
 
-    await update.message.reply_text(answer)
+
+async def answer_stream(user_id, reply):
+    if CHAT_MERGE_WINDOW:
+        await asyncio.sleep(CHAT_MERGE_WINDOW)
+    question = "\n".join(pending_messages.get(user_id, []))
+
+    route, model, prompt = text_route(question)
+    MODEL_ROUTES.inc(route=route)
+
+    # Первые токены уходят пользователю сразу, дальше сообщение дописывается правками.
+    # Сбой правки в Telegram — не сбой модели: генерация продолжается, ответ кэшируется
+    output = None
+    try:
+        async for output in predict_stream(model, prompt, priority=INTERACTIVE):
+            try:
+                await reply.update(output)
+            except TelegramError as e:
+                print(f"❌ Промежуточная правка ответа {user_id}: {e}")
+    except Exception as e:
+        pending_messages.pop(user_id, None)
+        quotas.forget(user_id)
+        return f"😔 Ошибка: {e}"
+
+    pending_messages.pop(user_id, None)
+    answer_cache.put(question, output)
+    return output or "Ответ недоступен"
 
 
 async def handle_photo(update: Update, context):
+    # Единый путь для фото и картинок, присланных документом (PNG, WebP, HEIC, большие JPEG)
     user_id = update.effective_user.id
     if user_id not in user_conversations:
         user_conversations[user_id] = []
 
-    await update.message.chat.send_action(ChatAction.UPLOAD_PHOTO)
+    # Pillow нужен только для фото, большинство апдейтов — текст
+    from media import IMAGE_MAX_BYTES, ImageRejected, download, prepare_image_async
+
+    message = update.message
+    media = message.photo[-1] if message.photo else message.document
+    caption = message.caption or ""
+    cache_key = f"{media.file_unique_id}\n{caption}"
+
+    cached = image_cache.get(cache_key)
+    if cached is not None:
+        await message.reply_text(cached)
+        return
+    if overloaded():
+        await message.reply_text(BUSY_REPLY)
+        return
+    if not await admit_user(update, "photo", cache_key):
+        return
+
+    await message.chat.send_action(ChatAction.UPLOAD_PHOTO)
     try:
-        photo = update.message.photo[-1]
-        photo_file = await photo.get_file()
-        photo_bytes = await photo_file.download_as_bytearray()
-
-        image = Image.open(io.BytesIO(photo_bytes)).convert("RGB")
-        image.thumbnail((1024, 1024))
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG", quality=85)
-        processed_bytes = buffer.getvalue()
-
-        caption = update.message.caption or ""
-        analysis = await analyze_image_yandex(processed_bytes, caption)
-        await update.message.reply_text(analysis)
+        if media.file_size and media.file_size > IMAGE_MAX_BYTES:
+            raise ImageRejected("Файл слишком большой для анализа")
+        with span("download"):
+            media_file = await media.get_file()
+            source = await download(media_file)
+
+        try:
+            with span("preprocess"):
+                processed_bytes = await prepare_image_async(source)
+        finally:
+            source.close()
+
+        analysis = await analyze_image_yandex(processed_bytes, caption, cache_key=cache_key)
+        if analysis is None:
+            quotas.forget(user_id)
+            analysis = "Ошибка при анализе изображения"
+        with span("reply_send"):
+            await message.reply_text(analysis)
+    except ImageRejected as e:
+        await message.reply_text(f"⚠️ {e}")
     except Exception as e:
-        await update.message.reply_text(f"⚠️ Ошибка обработки фото: {e}")
+        quotas.forget(user_id)
+        await message.reply_text(f"⚠️ Ошибка обработки фото: {e}")
 
 
 # ----------------- Main -----------------
-def main():
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+async def on_startup(app):
+    await start_metrics_server()
+    monitor.start()
+
+
+async def on_shutdown(app):
+    monitor.stop()
+
+
+def build_application():
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .rate_limiter(AIORateLimiter(overall_max_rate=25, max_retries=3))
+        .concurrent_updates(LaneUpdateProcessor())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    app = builder.build()
+
+    app.add_handler(TypeHandler(Update, track_update), group=-1)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("clear", clear_history))
     app.add_handler(CommandHandler("trends", trends))
+    app.add_handler(CommandHandler("subscribe", subscribe))
+    app.add_handler(CommandHandler("unsubscribe", unsubscribe))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    app.run_polling()
+    app.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_photo))
+    if PROFILE_DIR:
+        instrument(app)
+        app.add_handler(CommandHandler("profile", profile_command))
+    if DIGEST_INTERVAL:
+        # first=0: незавершённая после падения рассылка продолжается сразу при старте
+        first = 0 if broadcast_store.unfinished() else DIGEST_INTERVAL
+        app.job_queue.run_repeating(digest_job, interval=DIGEST_INTERVAL, first=first)
+    return app
+
+
+def main():
+    build_application().run_polling()
 
 
 if __name__ == "__main__":
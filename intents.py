@@ -0,0 +1,63 @@
+import os
+import re
+
+from answer_cache import normalize
+
+# Окончания для склонения: "мода" → моды, моде, моду, модой...; "тренд" → тренды, трендов...
+FEMININE_ENDINGS = ("а", "ы", "е", "у", "ой", "ою", "ам", "ами", "ах")
+MASCULINE_ENDINGS = ("", "а", "у", "ом", "е", "ы", "ов", "ам", "ами", "ах")
+# Сообщение длиннее этого уже не «просто привет», даже если начинается с него
+SMALLTALK_MAX_WORDS = int(os.environ.get("SMALLTALK_MAX_WORDS", 4))
+
+
+# ----------------- Роутер намерений -----------------
+class IntentRouter:
+    def __init__(self):
+        self._alternatives = {}
+        self._pattern = None
+
+    def add(self, intent, stems=None, words=()):
+        # stems: {основа: окончания}; words: точные слова или фразы
+        forms = self._alternatives.setdefault(intent, [])
+        for stem, endings in (stems or {}).items():
+            ending_group = "|".join(re.escape(e) for e in sorted(endings, key=len, reverse=True))
+            forms.append(f"{re.escape(stem)}(?:{ending_group})")
+        forms.extend(r"\s+".join(re.escape(w) for w in word.split()) for word in words)
+        self._pattern = None
+
+    def _compile(self):
+        # Одна регулярка на все намерения: сообщение сканируется один раз, сколько бы их ни было
+        groups = [f"(?P<{intent}>{'|'.join(forms)})" for intent, forms in self._alternatives.items()]
+        self._pattern = re.compile(r"(?<!\w)(?:" + "|".join(groups) + r")(?!\w)")
+
+    def route(self, text, whole=False):
+        # whole: сообщение целиком (без пунктуации) должно быть одной из фраз, а не содержать её
+        if self._pattern is None:
+            self._compile()
+        if whole:
+            match = self._pattern.fullmatch(normalize(text))
+        else:
+            match = self._pattern.search(text.casefold().replace("ё", "е"))
+        return match.lastgroup if match else None
+
+
+router = IntentRouter()
+router.add("news", stems={"мод": FEMININE_ENDINGS, "тренд": MASCULINE_ENDINGS}, words=["fashion"])
+
+# Отдельный роутер: «привет, что сейчас в моде?» должно уйти в news, а не в приветствие
+smalltalk = IntentRouter()
+smalltalk.add("greeting", words=[
+    "привет", "приветик", "здравствуй", "здравствуйте", "добрый день", "добрый вечер", "доброе утро",
+    "хай", "hi", "hello",
+])
+smalltalk.add("thanks", words=[
+    "спасибо", "спасибо большое", "большое спасибо", "благодарю", "спс", "thanks", "thank you",
+])
+
+
+def trivial(text):
+    # Намерение, если сообщение целиком — приветствие или благодарность, иначе None:
+    # «Привет, оцени образ» — это вопрос, и он должен дойти до модели
+    if len(normalize(text).split()) > SMALLTALK_MAX_WORDS:
+        return None
+    return smalltalk.route(text, whole=True)
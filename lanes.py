@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+
+from telegram.ext import BaseUpdateProcessor
+
+from intents import router
+from metrics import Counter, Gauge
+
+# Бюджеты параллельности по полосам; лёгкие команды идут вне полос и не ждут никого
+LANE_LIMITS = {
+    "chat": int(os.environ.get("LANE_CHAT", 16)),
+    "media": int(os.environ.get("LANE_MEDIA", 4)),
+    "digest": int(os.environ.get("LANE_DIGEST", 2)),
+}
+# Допуск: сколько апдейтов может ждать полосу и за сколько секунд (ожидание + обработка)
+# пользователь должен получить ответ; дальше новая тяжёлая работа не принимается
+LANE_SLO = {
+    "chat": float(os.environ.get("LANE_CHAT_SLO", 20)),
+    "media": float(os.environ.get("LANE_MEDIA_SLO", 30)),
+    "digest": float(os.environ.get("LANE_DIGEST_SLO", 60)),
+}
+LANE_MAX_WAITING = int(os.environ.get("LANE_MAX_WAITING", 64))
+FAST_COMMANDS = {"start", "help", "clear", "subscribe", "unsubscribe", "profile"}
+# Общий потолок BaseUpdateProcessor: с запасом, чтобы он сам не становился очередью для команд
+MAX_CONCURRENT_UPDATES = 256
+
+LANE_WAITING = Gauge("fashion_bot_lane_waiting", "Апдейты, ждущие своей полосы", ("lane",))
+LANE_INFLIGHT = Gauge("fashion_bot_lane_inflight", "Апдейты, обрабатываемые в полосе", ("lane",))
+LANE_SHED = Counter("fashion_bot_lane_shed_total", "Апдейты, не допущенные в перегруженную полосу", ("lane",))
+
+# True внутри обработчика апдейта, которому отказано в полосе: он должен ответить
+# из кэша или сообщением «занято», не трогая модель и сеть
+_shed = ContextVar("lane_shed", default=False)
+
+
+def overloaded():
+    return _shed.get()
+
+
+def classify(update):
+    message = getattr(update, "effective_message", None)
+    if message is None:
+        return "fast"
+    if message.photo or message.document:
+        return "media"
+    text = message.text or ""
+    if text.startswith("/"):
+        command = text[1:].split(maxsplit=1)[0].split("@")[0].lower() if len(text) > 1 else ""
+        return "fast" if command in FAST_COMMANDS else "digest" if command == "trends" else "chat"
+    if router.route(text) == "news":
+        return "digest"
+    return "chat"
+
+
+# ----------------- Полосы обработки апдейтов -----------------
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, limits=None, slo=None, max_waiting=LANE_MAX_WAITING):
+        super().__init__(MAX_CONCURRENT_UPDATES)
+        self.limits = dict(limits or LANE_LIMITS)
+        self.slo = dict(slo or LANE_SLO)
+        self.max_waiting = max_waiting
+        self.waiting = dict.fromkeys(self.limits, 0)
+        self.inflight = dict.fromkeys(self.limits, 0)
+        # Скользящее среднее времени обработки в полосе (EWMA), секунды
+        self.latency = dict.fromkeys(self.limits, 0.0)
+        # Время старта текущих обработок: пока медленные вызовы не завершились, EWMA о них не знает
+        self._running = {lane: [] for lane in self.limits}
+        self._semaphores = {}
+
+    def _publish(self, lane):
+        LANE_WAITING.set(self.waiting[lane], lane=lane)
+        LANE_INFLIGHT.set(self.inflight[lane], lane=lane)
+
+    def admit(self, lane):
+        waiting = self.waiting[lane]
+        if waiting >= self.max_waiting:
+            return False
+        # Пока очереди нет, пускаем всегда: так EWMA обновляется и полоса сама выходит из перегрузки.
+        # С очередью ожидание оцениваем по закону Литтла: waiting / limit обслуживаний впереди
+        if not waiting:
+            return True
+        oldest = time.monotonic() - min(self._running[lane], default=time.monotonic())
+        projected = (waiting / self.limits[lane] + 1) * max(self.latency[lane], oldest)
+        return projected <= self.slo[lane]
+
+    def _observe(self, lane, seconds):
+        previous = self.latency[lane]
+        self.latency[lane] = seconds if not previous else 0.8 * previous + 0.2 * seconds
+
+    async def do_process_update(self, update, coroutine):
+        lane = classify(update)
+        if lane == "fast":
+            await coroutine
+            return
+
+        if not self.admit(lane):
+            # Отказ обрабатывается тем же обработчиком, но вне очереди полосы
+            LANE_SHED.inc(lane=lane)
+            _shed.set(True)
+            await coroutine
+            return
+
+        # Семафор у каждой полосы свой и честный (FIFO) — это и есть её очередь
+        semaphore = self._semaphores[lane]
+        self.waiting[lane] += 1
+        self._publish(lane)
+        try:
+            await semaphore.acquire()
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+        finally:
+            self.waiting[lane] -= 1
+
+        self.inflight[lane] += 1
+        self._publish(lane)
+        started = time.monotonic()
+        self._running[lane].append(started)
+        try:
+            await coroutine
+        finally:
+            self._running[lane].remove(started)
+            self._observe(lane, time.monotonic() - started)
+            semaphore.release()
+            self.inflight[lane] -= 1
+            self._publish(lane)
+
+    async def initialize(self):
+        self._semaphores = {lane: asyncio.Semaphore(limit) for lane, limit in self.limits.items()}
+
+    async def shutdown(self):
+        pass
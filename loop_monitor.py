@@ -0,0 +1,76 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import Counter, Gauge, Histogram
+
+# Порог, после которого колбэк считается блокирующим; 0 — монитор выключен
+LOOP_SLOW_THRESHOLD = float(os.environ.get("LOOP_SLOW_THRESHOLD", 0.25))
+LOOP_TICK = 0.05
+
+LOOP_LAG = Histogram(
+    "fashion_bot_loop_lag_seconds", "Опоздание пробуждения event loop относительно плана",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_LAG_LAST = Gauge("fashion_bot_loop_lag_last_seconds", "Последнее измеренное опоздание event loop")
+SLOW_CALLBACKS = Counter("fashion_bot_slow_callbacks_total", "Колбэки, заблокировавшие loop дольше порога")
+
+
+# ----------------- Монитор event loop -----------------
+class LoopMonitor:
+    def __init__(self, threshold=LOOP_SLOW_THRESHOLD, tick=LOOP_TICK):
+        self.threshold = threshold
+        self.tick = tick
+        self.heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stopped = threading.Event()
+
+    async def _measure(self):
+        # Лаг = насколько позже запланированного loop вернул нам управление
+        while True:
+            planned = time.monotonic() + self.tick
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            lag = max(0.0, now - planned)
+            self.heartbeat = now
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+
+    def _watch(self):
+        # Отдельный поток: если heartbeat застыл, loop занят — снимаем стек его потока прямо сейчас
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat
+            if stalled < self.threshold:
+                if reported is not None:
+                    print(f"⚠️ Event loop был заблокирован {heartbeat - reported - self.tick:.2f} с")
+                    reported = None
+                continue
+            if reported is not None:
+                continue
+            reported = heartbeat
+            SLOW_CALLBACKS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "  (стек недоступен)\n"
+            print(f"⚠️ Колбэк блокирует event loop уже {stalled:.2f} с:\n{stack}", end="")
+
+    def start(self):
+        if not self.threshold:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+
+monitor = LoopMonitor()
@@ -0,0 +1,194 @@
+import asyncio
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from PIL import Image
+
+from metrics import Histogram
+
+ANALYSIS_SIZE = (1024, 1024)
+# Лимиты на вход: байты файла, пиксели полного декодирования и абсолютный потолок для JPEG с draft()
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 25_000_000))
+IMAGE_HARD_MAX_PIXELS = int(os.environ.get("IMAGE_HARD_MAX_PIXELS", 150_000_000))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+# До этого размера загрузка держится в памяти, дальше — во временном файле
+MEDIA_SPOOL_BYTES = int(os.environ.get("MEDIA_SPOOL_BYTES", 2 * 1024 * 1024))
+ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF"}
+# Кодирование для модели: целевой размер payload до base64 и допустимый диапазон качества
+IMAGE_PAYLOAD_BUDGET = int(os.environ.get("IMAGE_PAYLOAD_BUDGET", 180 * 1024))
+IMAGE_QUALITY_MAX = int(os.environ.get("IMAGE_QUALITY_MAX", 85))
+IMAGE_QUALITY_MIN = int(os.environ.get("IMAGE_QUALITY_MIN", 50))
+# Пробовать WebP — только если модель его принимает
+IMAGE_WEBP = os.environ.get("IMAGE_WEBP", "0") == "1"
+
+# HEIC/HEIF с iPhone — только если установлен необязательный pillow-heif
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+    ALLOWED_FORMATS.add("HEIF")
+except ImportError:
+    pass
+
+# Pillow сам откажется открывать больше этого — защита даже для путей в обход preflight
+Image.MAX_IMAGE_PIXELS = IMAGE_HARD_MAX_PIXELS
+
+# Декодирование идёт в ограниченном пуле: не блокирует event loop и держит память воркера в рамках
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="media")
+_client = None
+# Класс размера → (формат, качество, сабсэмплинг), подобранные в прошлый раз
+_encoder_settings = {}
+
+PAYLOAD_BYTES = Histogram(
+    "fashion_bot_image_payload_bytes", "Размер изображения, отправляемого в модель",
+    buckets=(16e3, 32e3, 64e3, 128e3, 192e3, 256e3, 384e3, 512e3, 1e6),
+)
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+# ----------------- Загрузка -----------------
+def _get_client():
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[0] is not loop:
+        _client = (loop, httpx.AsyncClient(timeout=60))
+    return _client[1]
+
+
+async def download(telegram_file):
+    # Потоково, с обрывом на лимите: большой документ не собирается целиком в bytearray
+    spool = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_BYTES)
+    try:
+        size = 0
+        async with _get_client().stream("GET", telegram_file.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(64 * 1024):
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ImageRejected("Файл слишком большой для анализа")
+                spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+# ----------------- Проверка заголовка -----------------
+def inspect_image(source):
+    # source — байты или файловый объект. Image.open читает только заголовок:
+    # формат и размеры известны без декодирования пикселей
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    source.seek(0, io.SEEK_END)
+    if source.tell() > IMAGE_MAX_BYTES:
+        raise ImageRejected("Файл слишком большой для анализа")
+    source.seek(0)
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError:
+        raise ImageRejected("Изображение слишком большое для анализа")
+    except Exception:
+        raise ImageRejected("Не удалось распознать изображение")
+
+    if image.format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"Формат {image.format} не поддерживается")
+
+    width, height = image.size
+    pixels = width * height
+    if pixels > IMAGE_HARD_MAX_PIXELS:
+        raise ImageRejected("Изображение слишком большое для анализа")
+    # JPEG декодируется сразу уменьшенным (DCT-масштабирование до 1/8), остальные — только целиком
+    if image.format not in ("JPEG", "MPO") and pixels > IMAGE_MAX_PIXELS:
+        raise ImageRejected("Изображение слишком большое для анализа")
+    return image
+
+
+# ----------------- Подготовка фото к анализу -----------------
+def prepare_image(source):
+    image = inspect_image(source)
+    if image.format in ("JPEG", "MPO"):
+        image.draft("RGB", ANALYSIS_SIZE)
+        width, height = image.size
+        if width * height > IMAGE_MAX_PIXELS:
+            raise ImageRejected("Изображение слишком большое для анализа")
+
+    image = image.convert("RGB")
+    image.thumbnail(ANALYSIS_SIZE)
+    payload = encode_for_analysis(image)
+    PAYLOAD_BYTES.observe(len(payload))
+    return payload
+
+
+# ----------------- Кодирование под бюджет -----------------
+def _encode(image, image_format, quality, subsampling):
+    buffer = io.BytesIO()
+    if image_format == "WEBP":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, subsampling=subsampling, optimize=True)
+    return buffer.getvalue()
+
+
+def _search(image, image_format, subsampling, budget):
+    # Бинарный поиск наибольшего качества, укладывающегося в бюджет
+    low, high = IMAGE_QUALITY_MIN, IMAGE_QUALITY_MAX
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, image_format, quality, subsampling)
+        if len(data) <= budget:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def encode_for_analysis(image, budget=None):
+    # EXIF и ICC не нужны модели: info очищаем, чтобы Pillow их не переносил
+    budget = budget or IMAGE_PAYLOAD_BUDGET
+    image.info = {}
+    size_class = (image.width * image.height) // (128 * 128)
+
+    # Настройки, подобранные для этого класса размера, обычно подходят с первой попытки
+    cached = _encoder_settings.get(size_class)
+    if cached:
+        data = _encode(image, *cached)
+        if 0.7 * budget <= len(data) <= budget or (len(data) <= budget and cached[1] == IMAGE_QUALITY_MAX):
+            return data
+
+    # 4:4:4 на максимальном качестве, если помещается; иначе 4:2:0 и подбор качества
+    candidates = []
+    data = _encode(image, "JPEG", IMAGE_QUALITY_MAX, 0)
+    if len(data) <= budget:
+        candidates.append((data, ("JPEG", IMAGE_QUALITY_MAX, 0)))
+    else:
+        found = _search(image, "JPEG", 2, budget)
+        if found:
+            candidates.append((found[0], ("JPEG", found[1], 2)))
+    if IMAGE_WEBP:
+        found = _search(image, "WEBP", 0, budget)
+        if found:
+            candidates.append((found[0], ("WEBP", found[1], 0)))
+
+    if not candidates:
+        # Даже минимальное качество не влезает — отдаём минимальное, чем отказывать
+        settings = ("JPEG", IMAGE_QUALITY_MIN, 2)
+        candidates.append((_encode(image, *settings), settings))
+
+    # Предпочитаем более высокое качество, при равенстве — меньший размер
+    data, settings = max(candidates, key=lambda c: (c[1][1], -len(c[0])))
+    _encoder_settings[size_class] = settings
+    return data
+
+
+async def prepare_image_async(source):
+    return await asyncio.get_running_loop().run_in_executor(_executor, prepare_image, source)
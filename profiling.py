@@ -0,0 +1,130 @@
+import asyncio
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from metrics import current_trace
+
+# Пусто — профилирование выключено, обработчики не оборачиваются
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()}
+PROFILE_MAX_SECONDS = 300
+
+_profiling = False
+
+
+def _output_dir():
+    path = Path(PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+# ----------------- Трассы апдейтов -----------------
+def _write_trace(record):
+    path = _output_dir() / f"traces-{datetime.now():%Y%m%d}.jsonl"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def traced(callback):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        stages = []
+        token = current_trace.set(stages)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            current_trace.reset(token)
+            user = getattr(update, "effective_user", None)
+            _write_trace({
+                "time": datetime.now().isoformat(timespec="milliseconds"),
+                "update_id": getattr(update, "update_id", None),
+                "user_id": user.id if user else None,
+                "handler": callback.__name__,
+                "seconds": round(time.perf_counter() - started, 6),
+                "stages": stages,
+                "error": error,
+            })
+
+    return wrapper
+
+
+def instrument(app):
+    # Оборачиваем уже зарегистрированные обработчики, не меняя их регистрацию в build_application;
+    # служебные группы (< 0) не трассируем
+    for group, handlers in app.handlers.items():
+        if group < 0:
+            continue
+        for handler in handlers:
+            handler.callback = traced(handler.callback)
+
+
+# ----------------- Профиль по команде -----------------
+async def _capture(seconds):
+    stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+    out = _output_dir()
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+    baseline = tracemalloc.take_snapshot()
+
+    # cProfile снимает поток event loop — там же работают все обработчики
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+    cpu_path = out / f"cpu-{stamp}.prof"
+    profiler.dump_stats(cpu_path)
+    mem_path = out / f"mem-{stamp}.tracemalloc"
+    snapshot.dump(str(mem_path))
+    top_path = out / f"mem-{stamp}.txt"
+    with open(top_path, "w", encoding="utf-8") as f:
+        for stat in snapshot.compare_to(baseline, "lineno")[:30]:
+            f.write(f"{stat}\n")
+    return [cpu_path.name, mem_path.name, top_path.name]
+
+
+async def profile_command(update, context):
+    global _profiling
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    if _profiling:
+        await update.message.reply_text("⏳ Профилирование уже идёт")
+        return
+
+    try:
+        seconds = min(PROFILE_MAX_SECONDS, max(1, int(context.args[0]))) if context.args else 30
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [секунды]")
+        return
+
+    _profiling = True
+    await update.message.reply_text(f"🔬 Снимаю профиль CPU и памяти {seconds} с...")
+
+    async def run():
+        global _profiling
+        try:
+            files = await _capture(seconds)
+            await update.message.reply_text("✅ Профиль сохранён:\n" + "\n".join(files))
+        except Exception as e:
+            print(f"❌ Ошибка профилирования: {e}")
+        finally:
+            _profiling = False
+
+    context.application.create_task(run())
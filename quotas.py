@@ -0,0 +1,87 @@
+import os
+import time
+from collections import Counter as Tally
+
+from answer_cache import normalize
+from metrics import Counter
+
+# Личный token bucket: QUOTA_BURST запросов подряд, дальше QUOTA_REFILL запросов в секунду
+QUOTA_BURST = float(os.environ.get("QUOTA_BURST", 5))
+QUOTA_REFILL = float(os.environ.get("QUOTA_REFILL", 0.2))
+# Стоимость запроса в токенах: анализ фото дороже текстового ответа
+QUOTA_COST = {
+    "text": float(os.environ.get("QUOTA_COST_TEXT", 1)),
+    "photo": float(os.environ.get("QUOTA_COST_PHOTO", 2)),
+}
+# Повтор того же текста в этом окне не обрабатывается — ответ на первый уже в пути
+QUOTA_DUPLICATE_WINDOW = float(os.environ.get("QUOTA_DUPLICATE_WINDOW", 10))
+# Выше этого числа пользователей забываем полностью восстановившиеся корзины
+QUOTA_MAX_USERS = int(os.environ.get("QUOTA_MAX_USERS", 10000))
+
+QUOTA_DECISIONS = Counter("fashion_bot_quota_total", "Решения квот по запросам пользователей", ("kind", "result"))
+
+
+# ----------------- Квоты пользователей -----------------
+class UserQuotas:
+    def __init__(self, burst=QUOTA_BURST, refill=QUOTA_REFILL, costs=None, duplicate_window=QUOTA_DUPLICATE_WINDOW):
+        self.burst = burst
+        self.refill = refill
+        self.costs = dict(costs or QUOTA_COST)
+        self.duplicate_window = duplicate_window
+        # user_id → (токены, время последнего пересчёта)
+        self._buckets = {}
+        # user_id → (ключ последнего запроса, когда он пришёл)
+        self._last = {}
+        # Запросы пользователей, о которых квоты ещё помнят; забывается вместе с корзиной
+        self.usage = Tally()
+
+    def _tokens(self, user_id, now):
+        tokens, updated = self._buckets.get(user_id, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.refill)
+
+    def _prune(self):
+        # Чистим пачкой, только когда перешли верхнюю отметку: сортировка раз на QUOTA_MAX_USERS / 4
+        # новых пользователей, а не проход по всем корзинам на каждое сообщение.
+        # Дольше всех молчавшие забываются первыми — их корзины уже полны или почти полны
+        if len(self._buckets) <= QUOTA_MAX_USERS * 1.25:
+            return
+        by_age = sorted(self._buckets, key=lambda user_id: self._buckets[user_id][1])
+        for user_id in by_age[:len(self._buckets) - QUOTA_MAX_USERS]:
+            del self._buckets[user_id]
+            self._last.pop(user_id, None)
+            self.usage.pop(user_id, None)
+
+    def check(self, user_id, kind, key=""):
+        # "ok", "duplicate" или "limited"; токены списываются только при "ok"
+        now = time.monotonic()
+        key = f"{kind}:{normalize(key)}"
+        last = self._last.get(user_id)
+        if last and last[0] == key and now - last[1] < self.duplicate_window:
+            QUOTA_DECISIONS.inc(kind=kind, result="duplicate")
+            return "duplicate"
+
+        tokens = self._tokens(user_id, now)
+        cost = self.costs.get(kind, 1)
+        if tokens < cost:
+            self._buckets[user_id] = (tokens, now)
+            QUOTA_DECISIONS.inc(kind=kind, result="limited")
+            return "limited"
+
+        self._buckets[user_id] = (tokens - cost, now)
+        self._last[user_id] = (key, now)
+        self.usage[user_id] += 1
+        QUOTA_DECISIONS.inc(kind=kind, result="ok")
+        self._prune()
+        return "ok"
+
+    def forget(self, user_id, kind=None, key=None):
+        # Запрос не удался — повтор того же сообщения уже не дубль. С kind и key забываем,
+        # только если помним именно этот запрос, а не более новый
+        last = self._last.get(user_id)
+        if last and (kind is None or last[0] == f"{kind}:{normalize(key or '')}"):
+            del self._last[user_id]
+
+    def retry_after(self, user_id, kind):
+        now = time.monotonic()
+        missing = self.costs.get(kind, 1) - self._tokens(user_id, now)
+        return max(0.0, missing / self.refill) if self.refill else float("inf")
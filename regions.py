@@ -0,0 +1,111 @@
+import asyncio
+import os
+import random
+import time
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import Counter, Gauge
+
+load_dotenv(dotenv_path=Path(__file__).parent / ".env")
+# Список регионов через запятую; YANDEX_REGION — один регион, как раньше
+YANDEX_REGIONS = [
+    region.strip()
+    for region in (os.environ.get("YANDEX_REGIONS") or os.environ.get("YANDEX_REGION") or "").split(",")
+    if region.strip()
+]
+# Переопределение адресов API (через запятую), например для локальных заглушек в бенчмарках
+YANDEX_API_URL = os.environ.get("YANDEX_API_URL")
+# Как часто замерять задержку до каждого региона, секунды; 0 — только по живому трафику
+YANDEX_PROBE_INTERVAL = float(os.environ.get("YANDEX_PROBE_INTERVAL", 30))
+# Сколько регион отдыхает после ошибки; при повторных ошибках подряд — вдвое дольше, до 8 раз
+YANDEX_FAILOVER_COOLDOWN = float(os.environ.get("YANDEX_FAILOVER_COOLDOWN", 30))
+
+ENDPOINT_LATENCY = Gauge("fashion_bot_endpoint_latency_seconds", "Сглаженная задержка региона", ("endpoint",))
+ENDPOINT_FAILURES = Counter("fashion_bot_endpoint_failures_total", "Ошибки, выведшие регион из ротации", ("endpoint",))
+
+
+def endpoints():
+    if YANDEX_API_URL:
+        return [url.strip().rstrip("/") for url in YANDEX_API_URL.split(",") if url.strip()]
+    return [f"https://{region}.api.cloud.yandex.net" for region in YANDEX_REGIONS]
+
+
+# ----------------- Выбор региона -----------------
+class EndpointResolver:
+    def __init__(self, urls, probe_interval=YANDEX_PROBE_INTERVAL, cooldown=YANDEX_FAILOVER_COOLDOWN):
+        self.urls = list(urls)
+        self.probe_interval = probe_interval
+        self.cooldown = cooldown
+        self.latency = dict.fromkeys(self.urls)
+        self.failures = dict.fromkeys(self.urls, 0)
+        self.down_until = dict.fromkeys(self.urls, 0.0)
+        self._prober = None
+
+    def pick(self):
+        if len(self.urls) == 1:
+            return self.urls[0]
+        self._ensure_prober()
+
+        now = time.monotonic()
+        healthy = [url for url in self.urls if self.down_until[url] <= now]
+        if not healthy:
+            # Лежат все — пробуем тот, что вернётся в ротацию раньше остальных
+            return min(self.urls, key=self.down_until.get)
+
+        # Вес обратно пропорционален квадрату задержки: быстрый регион получает почти весь трафик,
+        # остальные — ровно столько, чтобы их замеры не устаревали. Незамеренный считаем быстрым
+        known = [self.latency[url] for url in healthy if self.latency[url]]
+        default = min(known) if known else 1.0
+        weights = [1 / (self.latency[url] or default) ** 2 for url in healthy]
+        return random.choices(healthy, weights=weights)[0]
+
+    def observe(self, url, seconds, probe=False):
+        self.failures[url] = 0
+        self.down_until[url] = 0.0
+        # Время живого вызова включает работу модели и несравнимо с замерами: при включённых
+        # замерах задержку региона определяют только они, иначе трафик качался бы между регионами
+        if self.probe_interval and not probe:
+            return
+        previous = self.latency.get(url)
+        self.latency[url] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+        ENDPOINT_LATENCY.set(round(self.latency[url], 4), endpoint=url)
+
+    def fail(self, url):
+        if len(self.urls) == 1:
+            return
+        self.failures[url] += 1
+        self.down_until[url] = time.monotonic() + self.cooldown * min(8, 2 ** (self.failures[url] - 1))
+        ENDPOINT_FAILURES.inc(endpoint=url)
+
+    # ----------------- Активные замеры -----------------
+    def _ensure_prober(self):
+        if not self.probe_interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self._prober is None or self._prober[0] is not loop or self._prober[1].done():
+            self._prober = (loop, loop.create_task(self._probe_loop()))
+
+    async def _probe(self, client, url):
+        # Любой ответ, кроме 5xx, значит, что регион доступен; время ответа — его задержка
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError:
+            self.fail(url)
+            return
+        if response.status_code >= 500:
+            self.fail(url)
+        else:
+            self.observe(url, time.perf_counter() - started, probe=True)
+
+    async def _probe_loop(self):
+        async with httpx.AsyncClient(timeout=5) as client:
+            while True:
+                await asyncio.gather(*(self._probe(client, url) for url in self.urls))
+                await asyncio.sleep(self.probe_interval)
+
+
+resolver = EndpointResolver(endpoints())
@@ -1,32 +1,46 @@
+import argparse
+import asyncio
+import os
+import time
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-import os
-import httpx
-import base64
+from urllib.parse import urljoin, urlsplit
+
+from article_cache import ArticleCache
+from metrics import span
+from yandex_client import BACKGROUND, predict
 
-YANDEX_API_KEY = os.environ.get("YANDEX_API_KEY")
-YANDEX_REGION = os.environ.get("YANDEX_REGION")
 YANDEX_TEXT_MODEL = "general-text-summarizer"
 
 HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Заглушка вместо дайджеста, когда не ответил ни один источник — её не рассылают и не публикуют
+NO_NEWS = "Нет свежих модных новостей 😔"
+# Период пересборки дайджеста в режиме сервиса (--serve), секунды
+SCRAPER_INTERVAL = float(os.environ.get("SCRAPER_INTERVAL", 1800))
+
+# Общая сессия: keep-alive между запросами к одному сайту и точка подмены транспорта для бенчмарков
+session = requests.Session()
+session.headers.update(HEADERS)
+article_cache = ArticleCache()
 
 # ----------------- Функции парсинга -----------------
 def fetch_site(url, selectors, site_name, max_items=5):
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        items = []
-
-        for x in soup.select(selectors)[:max_items]:
-            text = x.get_text(strip=True)
-            link = x.get("href")
-            if not text:
-                continue
-            if link and not link.startswith("http"):
-                link = urljoin(url, link)
-            items.append({"title": text, "url": link or url})
+        with span("site_download", source=site_name):
+            response = session.get(url, timeout=10)
+            response.raise_for_status()
+        with span("site_parse", source=site_name):
+            soup = BeautifulSoup(response.text, "html.parser")
+            items = []
+
+            for x in soup.select(selectors)[:max_items]:
+                text = x.get_text(strip=True)
+                link = x.get("href")
+                if not text:
+                    continue
+                if link and not link.startswith("http"):
+                    link = urljoin(url, link)
+                items.append({"title": text, "url": link or url})
 
         return {"site": site_name, "articles": items} if items else None
     except Exception as e:
@@ -35,80 +49,131 @@ def fetch_site(url, selectors, site_name, max_items=5):
 
 
 def fetch_article_text(url):
+    # Текст статьи по ссылке не меняется — повторные дайджесты берут его из кэша
+    cached = article_cache.get(url)
+    if cached is not None:
+        return cached
+
+    host = urlsplit(url).netloc
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        paragraphs = soup.find_all("p")
-        text = "\n".join([p.get_text(strip=True) for p in paragraphs])
-        return text[:3000]
+        with span("article_download", source=host):
+            response = session.get(url, timeout=10)
+            response.raise_for_status()
+        with span("article_parse", source=host):
+            soup = BeautifulSoup(response.text, "html.parser")
+            paragraphs = soup.find_all("p")
+            text = "\n".join([p.get_text(strip=True) for p in paragraphs])[:3000]
+        article_cache.put(url, text)
+        return text
     except Exception as e:
         print(f"❌ Ошибка при парсинге статьи {url}: {e}")
         return ""
 
 
 # ----------------- Сбор новостей -----------------
+SOURCES = [
+    ("https://www.wgsn.com/en", "h2 a, h3 a", "WGSN"),
+    ("https://coloro.com/", "h2 a, h3 a", "Coloro"),
+    ("https://www.businessoffashion.com/", "h3 a", "Business of Fashion"),
+    ("https://about.nike.com/en/newsroom", "h2 a", "Nike News"),
+    ("https://www.footyheadlines.com/", "h3 a", "FootyHeadlines"),
+    ("https://www.sports.ru/style/", "h2 a, h3 a", "Sports.ru — Стиль"),
+    ("https://wwd.com/", "h3 a", "WWD"),
+    ("https://theblueprint.ru/", "h2 a, h3 a", "Blueprint"),
+]
+
+
 def get_sources():
-    return [
-        fetch_site("https://www.wgsn.com/en", "h2 a, h3 a", "WGSN"),
-        fetch_site("https://coloro.com/", "h2 a, h3 a", "Coloro"),
-        fetch_site("https://www.businessoffashion.com/", "h3 a", "Business of Fashion"),
-        fetch_site("https://about.nike.com/en/newsroom", "h2 a", "Nike News"),
-        fetch_site("https://www.footyheadlines.com/", "h3 a", "FootyHeadlines"),
-        fetch_site("https://www.sports.ru/style/", "h2 a, h3 a", "Sports.ru — Стиль"),
-        fetch_site("https://wwd.com/", "h3 a", "WWD"),
-        fetch_site("https://theblueprint.ru/", "h2 a, h3 a", "Blueprint"),
-    ]
+    return [fetch_site(url, selectors, site_name) for url, selectors, site_name in SOURCES]
 
 
 # ----------------- Генерация кратких выжимок через YandexGPT -----------------
-def summarize_articles_with_yandex(articles):
-    url = f"https://{YANDEX_REGION}.api.cloud.yandex.net/ai/v1/models/{YANDEX_TEXT_MODEL}:predict"
-    headers = {"Authorization": f"Bearer {YANDEX_API_KEY}"}
-    summaries = []
+async def summarize_article(art):
+    prompt = f"Ты AI-стилист и журналист моды. Сделай краткую выжимку:\nЗаголовок: {art['title']}\nСсылка: {art['url']}\nТекст: {art['text']}"
 
-    for art in articles:
-        text = art.get("text") or ""
-        if not text:
-            continue
+    try:
+        summary_text = await predict(YANDEX_TEXT_MODEL, prompt, priority=BACKGROUND)
+        if not summary_text:
+            summary_text = f"{art['title']} — краткая выжимка недоступна"
+    except Exception as e:
+        print(f"❌ YandexGPT ошибка для {art['title']}: {e}")
+        summary_text = f"{art['title']} — ошибка при генерации"
 
-        prompt = f"Ты AI-стилист и журналист моды. Сделай краткую выжимку:\nЗаголовок: {art['title']}\nСсылка: {art['url']}\nТекст: {text}"
+    return f"• [{art['title']}]({art['url']}): {summary_text}"
 
-        payload = {"instances": [{"text": prompt}]}
 
-        try:
-            response = httpx.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            summary_text = data.get("predictions", [{}])[0].get("output_text", "")
-            if not summary_text:
-                summary_text = f"{art['title']} — краткая выжимка недоступна"
-        except Exception as e:
-            print(f"❌ YandexGPT ошибка для {art['title']}: {e}")
-            summary_text = f"{art['title']} — ошибка при генерации"
+async def summarize_articles_with_yandex(articles):
+    # Запросы идут параллельно: общий лимитер в yandex_client держит квоту и пропускает чат вперёд
+    articles = [art for art in articles if art.get("text")]
+    summaries = await asyncio.gather(*(summarize_article(art) for art in articles))
+    return "\n".join(summaries)
 
-        summaries.append(f"• [{art['title']}]({art['url']}): {summary_text}")
 
-    return "\n".join(summaries)
+def fetch_articles_text(articles):
+    for art in articles:
+        art["text"] = fetch_article_text(art["url"])
 
 
-def get_fashion_news_with_summary():
-    sources = get_sources()
+async def build_digest():
+    # Текст дайджеста и метаданные статей (сайт, заголовок, ссылка) для снимка
+    # Парсинг на requests блокирующий — уводим его из event loop в поток
+    sources = await asyncio.to_thread(get_sources)
     news_summaries = []
+    metadata = []
 
     for src in sources:
         if not src:
             continue
         articles = src["articles"]
-        for art in articles:
-            art["text"] = fetch_article_text(art["url"])
-        summary = summarize_articles_with_yandex(articles)
+        with span("articles_fetch", source=src["site"]):
+            await asyncio.to_thread(fetch_articles_text, articles)
+        with span("summarize", source=src["site"]):
+            summary = await summarize_articles_with_yandex(articles)
         news_summaries.append(f"✨ **{src['site']}**\n{summary}")
+        metadata += [(src["site"], art["title"], art["url"]) for art in articles]
+
+    text = "\n\n".join(news_summaries) if news_summaries else NO_NEWS
+    return text, metadata
 
-    return "\n\n".join(news_summaries) if news_summaries else "Нет свежих модных новостей 😔"
+
+async def get_fashion_news_with_summary():
+    text, _ = await build_digest()
+    return text
+
+
+# ----------------- Сервис дайджестов -----------------
+async def serve(interval=SCRAPER_INTERVAL):
+    # Отдельный процесс: краулинг и суммаризация не делят CPU и память с обработчиками бота
+    # В Procfile не входит: добавьте «scraper: python scraper.py --serve», когда воркеры
+    # запущены с DIGEST_SOURCE=store или snapshot
+    from digest_store import DigestStore
+    from snapshot import write_snapshot
+
+    store = DigestStore()
+    while True:
+        started = time.monotonic()
+        try:
+            news, metadata = await build_digest()
+            if not metadata:
+                # Не собрался ни один источник (сеть, DNS) — воркеры продолжают отдавать прошлый дайджест
+                print("⚠️ Ни один источник не ответил, дайджест не обновлён")
+            else:
+                version = store.publish(news)
+                # Снимок для воркеров, читающих через mmap (DIGEST_SOURCE=snapshot)
+                write_snapshot(version, time.time(), news, metadata)
+                print(f"📰 Дайджест v{version} опубликован за {time.monotonic() - started:.1f} с")
+        except Exception as e:
+            print(f"❌ Ошибка сборки дайджеста: {e}")
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
 
 
 if __name__ == "__main__":
-    print("🚀 Проверка парсера с YandexGPT:")
-    news = get_fashion_news_with_summary()
-    print(news)
+    parser = argparse.ArgumentParser(description="Парсер модных новостей")
+    parser.add_argument("--serve", action="store_true", help="собирать дайджест по расписанию в общее хранилище")
+    args = parser.parse_args()
+    if args.serve:
+        asyncio.run(serve())
+    else:
+        print("🚀 Проверка парсера с YandexGPT:")
+        news = asyncio.run(get_fashion_news_with_summary())
+        print(news)
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+
+# ----------------- Single-flight -----------------
+# Параллельные вызовы с одним ключом ждут одну и ту же задачу; успешный результат
+# ещё grace секунд отдаётся без повторного запуска
+class SingleFlight:
+    def __init__(self, grace=0.0, keep_last=False):
+        self.grace = grace
+        self.keep_last = keep_last
+        self._tasks = {}
+        # Сколько вызывающих сейчас ждут каждую задачу
+        self._waiters = {}
+        self._results = {}
+        # Последний успешный результат без срока годности — для деградации под нагрузкой
+        self._last = {}
+
+    def _done(self, key, task):
+        # Под ключом уже может быть новый вызов, если этот был отменён
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.grace:
+            self._results[key] = (task.result(), time.monotonic() + self.grace)
+        if self.keep_last:
+            self._last[key] = task.result()
+
+    def stale(self, key):
+        return self._last.get(key)
+
+    async def do(self, key, fn):
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[1] > time.monotonic():
+                return cached[0]
+            del self._results[key]
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        # shield: отмена одного ожидающего не должна отменять общую задачу — но если ушли все,
+        # задачу отменяем, чтобы не держать соединение и квоту ради ответа, который никому не нужен
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Сразу убираем из полёта: пришедший следом с тем же ключом начнёт новый вызов,
+                    # а не присоединится к отменяемому
+                    if self._tasks.get(key) is task:
+                        del self._tasks[key]
+                    task.cancel()
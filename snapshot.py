@@ -0,0 +1,110 @@
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+DIGEST_SNAPSHOT = os.environ.get("DIGEST_SNAPSHOT", str(Path(__file__).parent / "digest.snapshot"))
+
+# Заголовок: сигнатура, версия формата, резерв, версия дайджеста, время сборки, длина текста, число статей.
+# Дальше текст дайджеста в UTF-8, таблица статей (смещение и длина сайта, заголовка, ссылки
+# от начала блока строк) и сам блок строк
+MAGIC = b"FBDG"
+FORMAT = 1
+HEADER = struct.Struct("<4sHHQdII")
+ARTICLE = struct.Struct("<6I")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+# ----------------- Запись -----------------
+def write_snapshot(version, built_at, text, articles, path=DIGEST_SNAPSHOT):
+    # articles — (сайт, заголовок, ссылка). Файл пишется рядом и подменяется атомарным rename:
+    # читатель видит либо старый снимок, либо новый целиком
+    body = text.encode("utf-8")
+    table, blob = [], bytearray()
+    for fields in articles:
+        entry = []
+        for field in fields:
+            data = field.encode("utf-8")
+            entry += [len(blob), len(data)]
+            blob += data
+        table.append(ARTICLE.pack(*entry))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".snapshot-", delete=False) as tmp:
+        tmp.write(HEADER.pack(MAGIC, FORMAT, 0, version, built_at, len(body), len(table)))
+        tmp.write(body)
+        tmp.write(b"".join(table))
+        tmp.write(blob)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    os.replace(tmp.name, path)
+
+
+# ----------------- Чтение через mmap -----------------
+class Snapshot:
+    def __init__(self, buffer):
+        magic, fmt, _, self.version, self.built_at, self._text_len, self.count = HEADER.unpack_from(buffer)
+        if magic != MAGIC or fmt != FORMAT:
+            raise SnapshotError("Неизвестный формат снимка дайджеста")
+        self._buffer = buffer
+        self._table = HEADER.size + self._text_len
+        self._blob = self._table + self.count * ARTICLE.size
+        if self._blob > len(buffer):
+            raise SnapshotError("Снимок дайджеста обрезан")
+
+    @property
+    def text(self):
+        return self._buffer[HEADER.size:self._table].decode("utf-8")
+
+    def article(self, index):
+        fields = ARTICLE.unpack_from(self._buffer, self._table + index * ARTICLE.size)
+        return tuple(
+            self._buffer[self._blob + offset:self._blob + offset + length].decode("utf-8")
+            for offset, length in zip(fields[::2], fields[1::2])
+        )
+
+    def articles(self):
+        return [self.article(i) for i in range(self.count)]
+
+
+class SnapshotReader:
+    # Страницы снимка общие для всех воркеров (page cache); на каждый запрос — только stat файла,
+    # перечитывается он лишь после подмены писателем
+    def __init__(self, path=DIGEST_SNAPSHOT):
+        self.path = path
+        self._stamp = None
+        self._map = None
+        self._snapshot = None
+
+    def current(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._snapshot
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return self._snapshot
+
+        # Битый файл не перечитываем до следующей подмены
+        self._stamp = stamp
+        mapped = None
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            snapshot = Snapshot(mapped)
+        except (OSError, ValueError, struct.error) as e:
+            if mapped is not None:
+                mapped.close()
+            print(f"❌ Снимок дайджеста не прочитан: {e}")
+            return self._snapshot
+
+        # Срезы mmap — копии, ссылок на старое отображение не остаётся, его можно закрыть
+        old, self._map = self._map, mapped
+        self._snapshot = snapshot
+        if old is not None:
+            old.close()
+        return snapshot
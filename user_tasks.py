@@ -0,0 +1,39 @@
+import asyncio
+
+from metrics import Counter
+
+SUPERSEDED = Counter("fashion_bot_superseded_total", "Вызовы модели, отменённые более новым сообщением или /clear")
+
+
+class Superseded(Exception):
+    pass
+
+
+# ----------------- Текущая работа пользователя -----------------
+# У пользователя одна актуальная задача: новая отменяет предыдущую, /clear — любую
+class UserTasks:
+    def __init__(self):
+        self._tasks = {}
+
+    def cancel(self, user_id):
+        task = self._tasks.pop(user_id, None)
+        if task is not None and not task.done():
+            SUPERSEDED.inc()
+            task.cancel()
+            return True
+        return False
+
+    async def run(self, user_id, coroutine):
+        self.cancel(user_id)
+        task = asyncio.create_task(coroutine)
+        self._tasks[user_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Отменили задачу, а не сам обработчик — значит, её вытеснили
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                raise Superseded()
+            raise
+        finally:
+            if self._tasks.get(user_id) is task:
+                del self._tasks[user_id]
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from collections import deque
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import MODEL_RESPONSES, STAGE_SECONDS, Counter, span
+from regions import resolver
+from singleflight import SingleFlight
+
+load_dotenv(dotenv_path=Path(__file__).parent / ".env")
+YANDEX_API_KEY = os.environ.get("YANDEX_API_KEY")
+YANDEX_RPS = float(os.environ.get("YANDEX_RPS", 10))
+YANDEX_BURST = int(os.environ.get("YANDEX_BURST", 10))
+YANDEX_MAX_RETRIES = int(os.environ.get("YANDEX_MAX_RETRIES", 3))
+YANDEX_TIMEOUT = 30
+# Бэкенд умеет отдавать ответ по частям (NDJSON с накопленным output_text в каждой строке)
+YANDEX_STREAMING = os.environ.get("YANDEX_STREAMING", "0") == "1"
+# Хеджирование: если ответа нет дольше p95, отправляем дубль и берём первый ответ.
+# BUDGET — доля дублей от основных запросов, MIN_DELAY — не дублировать раньше этого
+YANDEX_HEDGE = os.environ.get("YANDEX_HEDGE", "0") == "1"
+YANDEX_HEDGE_BUDGET = float(os.environ.get("YANDEX_HEDGE_BUDGET", 0.05))
+YANDEX_HEDGE_MIN_DELAY = float(os.environ.get("YANDEX_HEDGE_MIN_DELAY", 0.2))
+
+# Классы приоритета: меньше — раньше
+INTERACTIVE = 0
+BACKGROUND = 1
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+HEDGES = Counter("fashion_bot_model_hedges_total", "Дублирующие запросы к модели", ("model", "result"))
+
+
+# ----------------- Token bucket с приоритетами -----------------
+class PriorityTokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        # Retry-After от API тормозит всех, а не только получившего 429
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority=INTERACTIVE):
+        self._refill()
+        if not self._waiters and self.tokens >= 1 and time.monotonic() >= self.paused_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+
+# ----------------- Хеджирование -----------------
+class Hedger:
+    def __init__(self, budget=YANDEX_HEDGE_BUDGET, min_delay=YANDEX_HEDGE_MIN_DELAY, window=200, min_samples=20):
+        self.budget = budget
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._window = window
+        # Длительности успешных запросов по моделям и p95, пересчитываемый не на каждый замер
+        self._samples = {}
+        self._p95 = {}
+        # Счётчик замеров по модели: окно после заполнения не растёт, по его длине каденс не отсчитать
+        self._observed = {}
+        # Каждый основной запрос добавляет budget жетонов, дубль тратит один
+        self._tokens = 0.0
+        self.sent = 0
+        self.won = 0
+
+    def observe(self, model, seconds):
+        samples = self._samples.setdefault(model, deque(maxlen=self._window))
+        samples.append(seconds)
+        observed = self._observed[model] = self._observed.get(model, 0) + 1
+        if len(samples) >= self.min_samples and observed % 10 == 0:
+            ordered = sorted(samples)
+            self._p95[model] = ordered[int(0.95 * (len(ordered) - 1))]
+
+    def delay(self, model):
+        p95 = self._p95.get(model)
+        return None if p95 is None else max(self.min_delay, p95)
+
+    def _allow(self):
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def run(self, model, call):
+        self._tokens = min(10.0, self._tokens + self.budget)
+        primary = asyncio.create_task(call())
+        delay = self.delay(model)
+        if delay is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._allow():
+                self.sent += 1
+                HEDGES.inc(model=model, result="sent")
+                tasks.add(asyncio.create_task(call()))
+
+            # Первый успешный ответ; ошибка одного из двух ещё не ошибка запроса
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None or not tasks:
+                        if task is not primary:
+                            self.won += 1
+                            HEDGES.inc(model=model, result="won")
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+limiter = PriorityTokenBucket(YANDEX_RPS, YANDEX_BURST)
+hedger = Hedger()
+_inflight = SingleFlight()
+_client = None
+
+
+def model_url(model, endpoint=None):
+    # Все вызовы модели идут через resolver: он выбирает регион и выводит упавшие из ротации
+    return f"{endpoint or resolver.pick()}/ai/v1/models/{model}:predict"
+
+
+def _get_client():
+    # Один клиент на процесс — переиспользуем соединения; пересоздаём, если сменился event loop
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client[0] is not loop:
+        _client = (loop, httpx.AsyncClient(timeout=YANDEX_TIMEOUT))
+    return _client[1]
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _backoff(attempt):
+    # Full jitter: равномерно от 0 до экспоненциального потолка
+    return random.uniform(0, min(10.0, 0.5 * 2 ** attempt))
+
+
+# ----------------- Запрос к модели -----------------
+async def _predict(model, instance, priority):
+    headers = {"Authorization": f"Bearer {YANDEX_API_KEY}"}
+    payload = {"instances": [instance]}
+
+    for attempt in range(YANDEX_MAX_RETRIES + 1):
+        await limiter.acquire(priority)
+        endpoint = resolver.pick()
+        started = time.perf_counter()
+        try:
+            with span("model_call", source=model):
+                response = await _get_client().post(model_url(model, endpoint), headers=headers, json=payload)
+        except httpx.TransportError:
+            MODEL_RESPONSES.inc(model=model, status="transport_error")
+            resolver.fail(endpoint)
+            if attempt == YANDEX_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+
+        MODEL_RESPONSES.inc(model=model, status=response.status_code)
+        if response.status_code >= 500:
+            # Следующая попытка уйдёт в другой регион
+            resolver.fail(endpoint)
+        if response.status_code in RETRY_STATUSES and attempt < YANDEX_MAX_RETRIES:
+            delay = _retry_after(response)
+            if delay is not None:
+                limiter.pause(delay)
+            await asyncio.sleep(delay if delay is not None else _backoff(attempt))
+            continue
+
+        response.raise_for_status()
+        hedger.observe(model, time.perf_counter() - started)
+        resolver.observe(endpoint, time.perf_counter() - started)
+        data = response.json()
+        return data.get("predictions", [{}])[0].get("output_text")
+
+
+async def predict(model, text, image=None, priority=INTERACTIVE):
+    instance = {"text": text}
+    if image is not None:
+        instance["image"] = image
+
+    # Одинаковые запросы, уже находящиеся в полёте, склеиваются в один
+    key = (model, hashlib.sha256(json.dumps(instance, sort_keys=True).encode("utf-8")).digest())
+    if YANDEX_HEDGE:
+        return await _inflight.do(key, lambda: hedger.run(model, lambda: _predict(model, instance, priority)))
+    return await _inflight.do(key, lambda: _predict(model, instance, priority))
+
+
+# ----------------- Потоковый ответ -----------------
+async def predict_stream(model, text, priority=INTERACTIVE):
+    # Отдаёт накопленный текст ответа по мере генерации; без стриминга — один кусок с полным ответом
+    if not YANDEX_STREAMING:
+        yield await predict(model, text, priority=priority)
+        return
+
+    headers = {"Authorization": f"Bearer {YANDEX_API_KEY}"}
+    payload = {"instances": [{"text": text}], "stream": True}
+    started = time.perf_counter()
+    fallback = False
+
+    await limiter.acquire(priority)
+    endpoint = resolver.pick()
+    client = _get_client()
+    request = client.build_request("POST", model_url(model, endpoint), headers=headers, json=payload)
+    try:
+        response = await client.send(request, stream=True)
+    except httpx.TransportError:
+        # До первого токена ничего не потеряно — в другой регион через обычный путь
+        MODEL_RESPONSES.inc(model=model, status="transport_error")
+        resolver.fail(endpoint)
+        yield await predict(model, text, priority=priority)
+        return
+
+    try:
+        MODEL_RESPONSES.inc(model=model, status=response.status_code)
+        if response.status_code >= 500:
+            resolver.fail(endpoint)
+        if response.status_code in RETRY_STATUSES:
+            # До первого токена ничего не потеряно — повторы и Retry-After отдаём обычному пути
+            fallback = True
+        else:
+            response.raise_for_status()
+            first = True
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                output = json.loads(line).get("predictions", [{}])[0].get("output_text")
+                if first:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage="model_first_token", source=model)
+                    first = False
+                yield output
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="model_call", source=model)
+    finally:
+        await response.aclose()
+
+    if fallback:
+        yield await predict(model, text, priority=priority)